@@ -0,0 +1,361 @@
+"""
+Offline load test: drives the real Dispatcher with synthetic updates.
+
+    python -m bot.benchmark --users 200 --latency 0.03
+
+Every update goes through the routers, middlewares, FSM storage and a
+temporary SQLite database exactly as in production; only the Telegram Bot API
+is replaced by a stub session that records calls and sleeps for the given
+latency. Reports throughput, per-flow latency percentiles and the number of
+API calls and DB queries each update costs.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+import typing
+from collections import Counter as CallCounter
+from datetime import datetime
+
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMediaGroup, TelegramMethod
+from aiogram.types import (
+    CallbackQuery, Chat, Contact, Document, Message, PhotoSize, Update, User as TgUser,
+)
+
+import bot.database.db as database
+from bot.database.buffer import user_upserts
+from bot.database.crud import add_or_update_user, assign_manager
+from bot.database.db import DB_CHECKOUTS
+from bot.database.fsm import SQLiteStorage
+from bot.handlers.commands import cancel_clears
+from bot.main import create_dispatcher
+from bot.middlewares.ledger import OutgoingLedgerMiddleware
+from bot.middlewares.metrics import TelegramMetricsMiddleware
+from bot.middlewares.outbound import OutboundScheduler
+from bot.services.analytics import analytics
+from bot.services.calculator import calculator
+from bot.services.catalog import car_catalog
+from bot.services.leads import lead_queue
+from bot.services.ledger import message_ledger
+from bot.services.media import media_registry
+from bot.services.notifications import staff_notifier
+
+COUNTRIES = ("japan", "korea", "china")
+BOT_ID = 123456
+
+class StubSession(BaseSession):
+    """Bot session that answers every method locally after `latency` seconds (±50%)."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: CallCounter[str] = CallCounter()
+        self._ids = itertools.count(1_000_000)
+
+    def _message(self, method: TelegramMethod) -> Message:
+        message_id = next(self._ids)
+        chat_id = getattr(method, "chat_id", None) or 1
+        kwargs = {}
+        name = type(method).__name__
+        if name in ("SendPhoto", "EditMessageMedia") or isinstance(method, SendMediaGroup):
+            kwargs["photo"] = [PhotoSize(file_id=f"photo-{message_id}", file_unique_id=f"p{message_id}",
+                                         width=1280, height=960)]
+        elif name == "SendDocument":
+            kwargs["document"] = Document(file_id=f"doc-{message_id}", file_unique_id=f"d{message_id}")
+        return Message(
+            message_id=message_id,
+            date=datetime.now(),
+            chat=Chat(id=chat_id, type="private" if isinstance(chat_id, int) and chat_id > 0 else "group"),
+            from_user=TgUser(id=BOT_ID, is_bot=True, first_name="bot"),
+            text=getattr(method, "text", None),
+            caption=getattr(method, "caption", None),
+            **kwargs,
+        )
+
+    def _result(self, method: TelegramMethod):
+        if isinstance(method, SendMediaGroup):
+            results = []
+            for item in method.media:
+                message = self._message(method)
+                if item.type == "document":
+                    message = message.model_copy(update={"photo": None, "document": Document(
+                        file_id=f"doc-{message.message_id}", file_unique_id=f"d{message.message_id}")})
+                results.append(message)
+            return results
+
+        returning = method.__returning__
+        options = typing.get_args(returning) or (returning,)
+        if Message in options:
+            return self._message(method)
+        if TgUser in options:
+            return TgUser(id=BOT_ID, is_bot=True, first_name="bot", username="benchmark_bot")
+        if bool in options:
+            return True
+        return returning.model_construct() if hasattr(returning, "model_construct") else None
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: int | None = None):
+        self.calls[method.__api_method__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        return self._result(method)
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+class UpdateFactory:
+    """Builds updates the way Telegram would deliver them for one chat."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, user_id: int):
+        self.user = TgUser(id=user_id, is_bot=False, first_name=f"User{user_id}", username=f"user{user_id}")
+        self.chat = Chat(id=user_id, type="private")
+
+    def _message(self, **kwargs) -> Message:
+        return Message(message_id=next(self._ids), date=datetime.now(), chat=self.chat, from_user=self.user, **kwargs)
+
+    def text(self, text: str) -> Update:
+        return Update(update_id=next(self._ids), message=self._message(text=text))
+
+    def contact(self, phone: str) -> Update:
+        contact = Contact(phone_number=phone, first_name=self.user.first_name, user_id=self.user.id)
+        return Update(update_id=next(self._ids), message=self._message(contact=contact))
+
+    def photo(self, media_group_id: str | None = None) -> Update:
+        n = next(self._ids)
+        photo = [PhotoSize(file_id=f"in-{n}", file_unique_id=f"in{n}", width=1280, height=960)]
+        return Update(update_id=next(self._ids), message=self._message(photo=photo, media_group_id=media_group_id))
+
+    def callback(self, data: str, with_photo: bool = False) -> Update:
+        # The message the button is attached to was sent by the bot
+        kwargs = {"photo": [PhotoSize(file_id="carousel", file_unique_id="carousel", width=1, height=1)]} \
+            if with_photo else {"text": "…"}
+        message = Message(message_id=next(self._ids), date=datetime.now(), chat=self.chat,
+                          from_user=TgUser(id=BOT_ID, is_bot=True, first_name="bot"), **kwargs)
+        query = CallbackQuery(id=str(next(self._ids)), from_user=self.user, chat_instance="bench",
+                              data=data, message=message)
+        return Update(update_id=next(self._ids), callback_query=query)
+
+# Flows: each returns a list of steps; a step is one update or a list of updates
+# delivered at the same time (an album)
+
+def flow_start(f: UpdateFactory):
+    return [f.text("/start")]
+
+def flow_survey(f: UpdateFactory):
+    return [
+        f.text("Расчет стоимости авто"),
+        f.callback(f"est_country_{random.choice(COUNTRIES)}"),
+        f.text("2 500 000"),
+        f.text("2.5"),
+        f.text("2021"),
+        f.text("181"),
+        f.callback("est_lead"),
+        f.text("Иванов Иван Иванович"),
+        f.contact("+79991234567"),
+    ]
+
+def flow_order_similar(f: UpdateFactory, car_ids: list[int]):
+    return [
+        f.callback(f"order_similar_{random.choice(car_ids)}", with_photo=True),
+        f.text("Петров Пётр"),
+        f.text("89991234567"),
+    ]
+
+def flow_browse(f: UpdateFactory, pages: dict[str, list[int]], flips: int = 5):
+    country = random.choice(COUNTRIES)
+    ids = pages[country]
+    steps = [f.text("Подборки авто"), f.callback(f"cars_{country}")]
+    for cursor in ids[:flips]:
+        steps.append(f.callback(f"carpage_{country}_{cursor}_next", with_photo=True))
+    steps.append(f.callback(f"carphotos_{ids[0]}", with_photo=True))
+    return steps
+
+def flow_add_car(f: UpdateFactory, album_size: int):
+    album = f"album-{f.user.id}-{random.random()}"
+    return [
+        f.text("Панель администратора"),
+        f.callback("admin_add_car"),
+        f.callback(f"add_car_{random.choice(COUNTRIES)}"),
+        [f.photo(album) for _ in range(album_size)],
+        f.text("Завершить отправку фото"),
+        f.text("Toyota Land Cruiser 300, 2022, 3.3d, 25 000 км"),
+    ]
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+async def seed(cars_per_country: int, staff: int) -> tuple[dict[str, list[int]], list[int]]:
+    """Fills the catalog and creates staff accounts. Returns car ids per country, newest first, and staff ids."""
+    pages = {}
+    for country in COUNTRIES:
+        ids = [await car_catalog.add_car(country, f"{country} car #{i}, 2021, 2.0 AT",
+                                         [(f"seed-{country}-{i}-{n}", None) for n in range(4)])
+               for i in range(cars_per_country)]
+        pages[country] = ids[::-1]
+
+    staff_ids = [900_000_000 + i for i in range(staff)]
+    for tg_id in staff_ids:
+        await add_or_update_user(tg_id, f"Manager {tg_id}", f"manager{tg_id}")
+        await assign_manager(tg_id)
+    return pages, staff_ids
+
+async def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bot-bench-")
+    database.DB_PATH = os.path.join(workdir, "bench.sqlite")
+    await database.init_db()
+    await database.open_db()
+    user_upserts.start()
+    await media_registry.load()
+    await car_catalog.load()
+    message_ledger.start()
+    lead_queue.path = os.path.join(workdir, "leads.journal")
+    await lead_queue.start()
+    calculator.load()
+    analytics.start()
+
+    session = StubSession(args.latency)
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=session, default=DefaultBotProperties(parse_mode="HTML"))
+    if args.scheduler:
+        bot.session.middleware(OutboundScheduler())
+    bot.session.middleware(OutgoingLedgerMiddleware())
+    bot.session.middleware(TelegramMetricsMiddleware())
+    storage = SQLiteStorage()
+    storage.start()
+    dp = create_dispatcher(storage)
+
+    pages, staff_ids = await seed(args.cars, args.staff)
+    car_ids = [car_id for ids in pages.values() for car_id in ids]
+
+    latencies: dict[str, list[float]] = {}
+    errors = 0
+
+    async def feed(flow: str, update: Update):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            errors += 1
+            logging.debug(f"{flow}: {e!r}")
+        latencies.setdefault(flow, []).append(time.perf_counter() - started)
+
+    async def play(flow: str, steps):
+        # Updates of one chat arrive in order; album parts arrive together
+        for step in steps:
+            if isinstance(step, list):
+                await asyncio.gather(*(feed(flow, update) for update in step))
+            else:
+                await feed(flow, step)
+
+    async def client(user_id: int):
+        f = UpdateFactory(user_id)
+        await play("start", flow_start(f))
+        await play("browse", flow_browse(f, pages))
+        await play("survey", flow_survey(f))
+        await play("order_similar", flow_order_similar(f, car_ids))
+
+    async def manager(user_id: int):
+        f = UpdateFactory(user_id)
+        for _ in range(args.albums):
+            await play("add_car", flow_add_car(f, args.album_size))
+
+    session.calls.clear()
+    # Cache hits and wrappers never reach SQLite, so count connections handed out, not crud calls
+    queries_before = DB_CHECKOUTS.total()
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(client(100_000 + i) for i in range(args.users)),
+        *(manager(tg_id) for tg_id in staff_ids),
+    )
+    elapsed = time.perf_counter() - started
+    await staff_notifier.drain()
+    await cancel_clears()
+
+    queries = DB_CHECKOUTS.total() - queries_before
+    updates = sum(len(v) for v in latencies.values())
+    api_calls = sum(session.calls.values())
+    all_latencies = [x for v in latencies.values() for x in v]
+
+    await storage.close()
+    await user_upserts.stop()
+    await lead_queue.stop()
+    await analytics.stop()
+    await message_ledger.stop()
+    await database.close_db()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "updates": updates,
+        "errors": errors,
+        "seconds": elapsed,
+        "updates_per_sec": updates / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(all_latencies, 0.5) * 1000,
+        "p99_ms": percentile(all_latencies, 0.99) * 1000,
+        "api_calls_per_update": api_calls / updates if updates else 0.0,
+        "db_queries_per_update": queries / updates if updates else 0.0,
+        "flows": {
+            flow: {
+                "updates": len(values),
+                "p50_ms": percentile(values, 0.5) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+            }
+            for flow, values in latencies.items()
+        },
+        "api_calls": dict(session.calls.most_common()),
+    }
+
+def print_report(report: dict):
+    print(f"updates:        {report['updates']} in {report['seconds']:.2f}s ({report['errors']} errors)")
+    print(f"throughput:     {report['updates_per_sec']:.1f} updates/s")
+    print(f"latency:        p50 {report['p50_ms']:.1f} ms, p99 {report['p99_ms']:.1f} ms")
+    print(f"per update:     {report['api_calls_per_update']:.2f} API calls, "
+          f"{report['db_queries_per_update']:.2f} DB queries")
+    print()
+    print(f"{'flow':<15}{'updates':>9}{'p50 ms':>10}{'p99 ms':>10}")
+    for flow, stats in report["flows"].items():
+        print(f"{flow:<15}{stats['updates']:>9}{stats['p50_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+    print()
+    print("API calls: " + ", ".join(f"{name} {count}" for name, count in report["api_calls"].items()))
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Dispatcher load test")
+    parser.add_argument("--users", type=int, default=100, help="concurrent clients, each running every client flow")
+    parser.add_argument("--staff", type=int, default=2, help="managers adding cars with albums")
+    parser.add_argument("--albums", type=int, default=3, help="cars added by each manager")
+    parser.add_argument("--album-size", type=int, default=8, help="photos per album")
+    parser.add_argument("--cars", type=int, default=20, help="seeded cars per country")
+    parser.add_argument("--latency", type=float, default=0.03, help="simulated Bot API latency, seconds")
+    parser.add_argument("--scheduler", action="store_true",
+                        help="route calls through the OutboundScheduler (adds Telegram rate limits)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    random.seed(args.seed)
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import asyncio
+import contextlib
+import logging
+
+from bot.config import ADMIN_IDS
+from bot.database.db import writer
+from bot.database.cache import user_cache
+
+class UserUpsertBuffer:
+    """
+    Coalesces add_or_update_user calls. Unchanged profiles are skipped using the
+    cached row; real changes are written in one executemany transaction every
+    `interval` seconds or as soon as `max_batch` users are pending.
+    """
+
+    def __init__(self, interval: float = 1.0, max_batch: int = 500):
+        self.interval = interval
+        self.max_batch = max_batch
+        self.skipped = 0
+        self.written = 0
+        self._pending: dict[int, tuple[str, str]] = {}
+        self._task: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def pending(self) -> int:
+        """Number of users waiting to be written."""
+        return len(self._pending)
+
+    def _is_unchanged(self, telegram_id: int, fullname: str, username: str) -> bool:
+        row = user_cache.get(telegram_id)
+        if row is None:
+            return False
+        expected_role = 'admin' if telegram_id in ADMIN_IDS else row['role']
+        return (row['fullname'], row['username'], row['role']) == (fullname, username, expected_role)
+
+    async def submit(self, telegram_id: int, fullname: str, username: str):
+        if telegram_id not in self._pending and self._is_unchanged(telegram_id, fullname, username):
+            self.skipped += 1
+            return
+
+        self._pending[telegram_id] = (fullname, username)
+        if self._task is None or len(self._pending) >= self.max_batch:
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+
+            admins = [(tg_id, fn, un) for tg_id, (fn, un) in batch.items() if tg_id in ADMIN_IDS]
+            users = [(tg_id, fn, un) for tg_id, (fn, un) in batch.items() if tg_id not in ADMIN_IDS]
+            try:
+                await self._write(admins, users)
+            except Exception:
+                # Keep the batch for the next attempt, newer submissions win
+                self._pending = {**batch, **self._pending}
+                raise
+
+            for tg_id in batch:
+                user_cache.invalidate(tg_id)
+            self.written += len(batch)
+
+    async def _write(self, admins: list[tuple], users: list[tuple]):
+        async with writer() as db:
+            if admins:
+                await db.executemany('''
+                    INSERT INTO users (telegram_id, fullname, username, role)
+                    VALUES (?, ?, ?, 'admin')
+                    ON CONFLICT(telegram_id) DO UPDATE SET
+                    fullname=excluded.fullname,
+                    username=excluded.username,
+                    role='admin';
+                ''', admins)
+            if users:
+                await db.executemany('''
+                    INSERT INTO users (telegram_id, fullname, username, role)
+                    VALUES (?, ?, ?, 'user')
+                    ON CONFLICT(telegram_id) DO UPDATE SET
+                    fullname=excluded.fullname,
+                    username=excluded.username;
+                ''', users)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Failed to flush user upserts: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops the background loop and writes whatever is still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush()
+
+user_upserts = UserUpsertBuffer()
@@ -1,10 +1,12 @@
-import aiosqlite
-import json
-from bot.database.db import DB_PATH
+import re
+import time
+from bot.database.db import reader, writer, timed
+from bot.database.cache import user_cache
 from bot.config import ADMIN_IDS
 
+@timed
 async def add_or_update_user(telegram_id: int, fullname: str, username: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with writer() as db:
         if telegram_id in ADMIN_IDS:
             await db.execute('''
                 INSERT INTO users (telegram_id, fullname, username, role)
@@ -22,132 +24,419 @@ async def add_or_update_user(telegram_id: int, fullname: str, username: str):
                 fullname=excluded.fullname,
                 username=excluded.username;
             ''', (telegram_id, fullname, username))
-        await db.commit()
+    user_cache.invalidate(telegram_id)
 
 async def get_user_by_tg_id(telegram_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    # Not timed itself: cache hits are counted by user_cache, only misses are queries
+    user = user_cache.get(telegram_id)
+    if user is not None:
+        return user
+
+    user = await select_user_by_tg_id(telegram_id)
+    if user is not None:
+        user_cache.set(telegram_id, user)
+    return user
+
+@timed
+async def select_user_by_tg_id(telegram_id: int):
+    """Reads the user row from the database, bypassing user_cache."""
+    async with reader() as db:
         async with db.execute('SELECT * FROM users WHERE telegram_id = ?', (telegram_id,)) as cursor:
             return await cursor.fetchone()
 
-async def add_request(telegram_id: int, fio: str, car_info: str, phone: str):
-    user = await get_user_by_tg_id(telegram_id)
-    if not user:
-        return None
-        
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute('''
-            INSERT INTO requests (user_id, fio, car_info, phone)
-            VALUES (?, ?, ?, ?)
-        ''', (user['id'], fio, car_info, phone))
-        
-        # update user's phone if we just got it
-        await db.execute('''
-            UPDATE users SET phone = ? WHERE id = ?
-        ''', (phone, user['id']))
-        await db.commit()
-
-async def get_all_users():
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute('SELECT * FROM users ORDER BY join_date DESC') as cursor:
-            return await cursor.fetchall()
+@timed
+async def add_leads(leads: list[dict]) -> int:
+    """
+    Writes survey leads in one transaction: creates missing users, stores the
+    phone and inserts the requests. Each lead is a dict with telegram_id,
+    fullname, username, fio, car_info, phone, created_at and an optional
+    unique key; leads whose key is already stored are skipped.
+    Returns the number of requests inserted.
+    """
+    async with writer() as db:
+        await db.executemany('''
+            INSERT INTO users (telegram_id, fullname, username, phone, role)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(telegram_id) DO UPDATE SET
+            phone=excluded.phone
+        ''', [
+            (lead['telegram_id'], lead.get('fullname'), lead.get('username'), lead['phone'],
+             'admin' if lead['telegram_id'] in ADMIN_IDS else 'user')
+            for lead in leads
+        ])
+        before = db.total_changes
+        await db.executemany('''
+            INSERT INTO requests (user_id, fio, car_info, phone, created_at, lead_key)
+            VALUES ((SELECT id FROM users WHERE telegram_id = ?), ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?)
+            ON CONFLICT(lead_key) WHERE lead_key IS NOT NULL DO NOTHING
+        ''', [
+            (lead['telegram_id'], lead['fio'], lead['car_info'], lead['phone'], lead.get('created_at'), lead.get('key'))
+            for lead in leads
+        ])
+        inserted = db.total_changes - before
+    for lead in leads:
+        user_cache.invalidate(lead['telegram_id'])
+    return inserted
+
+@timed
+async def get_users_page(cursor_id: int | None = None, direction: str = 'next', role: str | None = None,
+                         has_phone: bool | None = None, limit: int = 10):
+    """
+    Keyset page of users ordered by (join_date, id), newest first, optionally
+    filtered by role and by whether a phone is known.
+    'next' returns users older than cursor_id, 'prev' newer ones.
+    Returns (users, has_prev, has_next).
+    """
+    conditions, params = [], []
+    if role:
+        conditions.append('role = ?')
+        params.append(role)
+    if has_phone is not None:
+        conditions.append("phone IS NOT NULL AND phone != ''" if has_phone else "(phone IS NULL OR phone = '')")
 
+    backwards = direction == 'prev' and cursor_id is not None
+    if cursor_id is not None:
+        op = '>' if backwards else '<'
+        conditions.append(f'(join_date, id) {op} (SELECT join_date, id FROM users WHERE id = ?)')
+        params.append(cursor_id)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    order = 'ASC' if backwards else 'DESC'
+    query = f'SELECT * FROM users {where} ORDER BY join_date {order}, id {order} LIMIT ?'
+    params.append(limit + 1)
+
+    async with reader() as db:
+        async with db.execute(query, params) as cursor:
+            rows = await cursor.fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        return rows[::-1], has_more, True
+    return rows, cursor_id is not None, has_more
+
+@timed
+async def iter_users():
+    """Streams every user, newest first, without loading the table into memory."""
+    async with reader() as db:
+        async with db.execute('SELECT * FROM users ORDER BY join_date DESC, id DESC') as cursor:
+            async for row in cursor:
+                yield row
+
+@timed
+async def iter_requests():
+    """Streams every request, archived ones included, joined with its user, newest first."""
+    async with reader() as db:
+        async with db.execute('''
+            SELECT r.id, r.created_at, r.fio, r.car_info, r.phone,
+                   u.telegram_id, u.username
+            FROM (
+                SELECT id, created_at, fio, car_info, phone, user_id FROM requests
+                UNION ALL
+                SELECT id, created_at, fio, car_info, phone, user_id FROM requests_archive
+            ) r LEFT JOIN users u ON u.id = r.user_id
+            ORDER BY r.id DESC
+        ''') as cursor:
+            async for row in cursor:
+                yield row
+
+@timed
+async def archive_requests(before: str, limit: int) -> int:
+    """Moves up to `limit` requests created before `before` into requests_archive; returns how many."""
+    async with writer() as db:
+        async with db.execute(
+            'SELECT id FROM requests WHERE created_at < ? ORDER BY created_at LIMIT ?', (before, limit)
+        ) as cursor:
+            ids = [row[0] for row in await cursor.fetchall()]
+        if not ids:
+            return 0
+        placeholders = ','.join(['?'] * len(ids))
+        await db.execute(f'''
+            INSERT OR IGNORE INTO requests_archive (id, user_id, fio, car_info, phone, created_at, lead_key)
+            SELECT id, user_id, fio, car_info, phone, created_at, lead_key FROM requests
+            WHERE id IN ({placeholders})
+        ''', ids)
+        # The requests_fts triggers drop the moved rows from the search index
+        await db.execute(f'DELETE FROM requests WHERE id IN ({placeholders})', ids)
+        return len(ids)
+
+@timed
+async def incremental_vacuum(pages: int) -> int:
+    """Returns up to `pages` free pages to the file system; returns how many free pages are left."""
+    async with writer() as db:
+        # execute() steps a statement once, which frees a single page; a script runs it to the end
+        await db.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+        async with db.execute('PRAGMA freelist_count') as cursor:
+            return (await cursor.fetchone())[0]
+
+@timed
+async def optimize_db():
+    async with writer() as db:
+        await db.execute('PRAGMA optimize')
+
+@timed
 async def get_all_admins_and_managers():
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    async with reader() as db:
         async with db.execute("SELECT * FROM users WHERE role IN ('admin', 'manager')") as cursor:
             return await cursor.fetchall()
 
+@timed
 async def get_all_managers():
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    async with reader() as db:
         async with db.execute("SELECT * FROM users WHERE role = 'manager'") as cursor:
             return await cursor.fetchall()
             
+@timed
 async def assign_manager(target_identifier: str) -> bool:
     """
     Target identifier can be integer (telegram_id) or string (username without @).
     Updates user role to 'manager'. Returns True if successful.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with writer() as db:
         try:
             target_id = int(target_identifier)
-            query = "UPDATE users SET role = 'manager' WHERE telegram_id = ?"
+            query = "UPDATE users SET role = 'manager' WHERE telegram_id = ? RETURNING telegram_id"
             params = (target_id,)
         except ValueError:
             target_username = target_identifier.replace('@', '')
-            query = "UPDATE users SET role = 'manager' WHERE username = ?"
+            query = "UPDATE users SET role = 'manager' WHERE username = ? RETURNING telegram_id"
             params = (target_username,)
             
-        cursor = await db.execute(query, params)
-        await db.commit()
-        return cursor.rowcount > 0
+        async with db.execute(query, params) as cursor:
+            changed = await cursor.fetchall()
+
+    for row in changed:
+        user_cache.invalidate(row['telegram_id'])
+    return len(changed) > 0
 
+@timed
 async def remove_manager(target_identifier: str) -> bool:
     """
     Target identifier can be integer (telegram_id) or string (username without @).
     Updates user role to 'user' if they were 'manager'. Returns True if successful.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with writer() as db:
         try:
             target_id = int(target_identifier)
-            query = "UPDATE users SET role = 'user' WHERE telegram_id = ? AND role = 'manager'"
+            query = "UPDATE users SET role = 'user' WHERE telegram_id = ? AND role = 'manager' RETURNING telegram_id"
             params = (target_id,)
         except ValueError:
             target_username = target_identifier.replace('@', '')
-            query = "UPDATE users SET role = 'user' WHERE username = ? AND role = 'manager'"
+            query = "UPDATE users SET role = 'user' WHERE username = ? AND role = 'manager' RETURNING telegram_id"
             params = (target_username,)
             
-        cursor = await db.execute(query, params)
-        await db.commit()
-        return cursor.rowcount > 0
+        async with db.execute(query, params) as cursor:
+            changed = await cursor.fetchall()
 
-async def add_protected_message(chat_id: int, message_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute('''
-            INSERT OR IGNORE INTO protected_messages (chat_id, message_id)
-            VALUES (?, ?)
-        ''', (chat_id, message_id))
-        await db.commit()
+    for row in changed:
+        user_cache.invalidate(row['telegram_id'])
+    return len(changed) > 0
+
+@timed
+async def add_protected_messages(pairs: list[tuple[int, int]]):
+    """Records (chat_id, message_id) pairs that must survive chat cleanup."""
+    if not pairs:
+        return
+    now = time.time()
+    async with writer() as db:
+        await db.executemany('''
+            INSERT OR IGNORE INTO protected_messages (chat_id, message_id, created_at)
+            VALUES (?, ?, ?)
+        ''', [(chat_id, message_id, now) for chat_id, message_id in pairs])
 
+@timed
+async def purge_protected_messages(before: float, limit: int) -> int:
+    """Deletes up to `limit` protected message rows created before `before`; returns how many."""
+    async with writer() as db:
+        cursor = await db.execute('''
+            DELETE FROM protected_messages WHERE rowid IN (
+                SELECT rowid FROM protected_messages WHERE created_at < ? LIMIT ?
+            )
+        ''', (before, limit))
+        return cursor.rowcount
+
+@timed
 async def get_protected_message_ids(chat_id: int, message_ids: list[int]) -> set[int]:
     if not message_ids:
         return set()
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with reader() as db:
         placeholders = ','.join(['?'] * len(message_ids))
         query = f'SELECT message_id FROM protected_messages WHERE chat_id = ? AND message_id IN ({placeholders})'
         async with db.execute(query, (chat_id, *message_ids)) as cursor:
             rows = await cursor.fetchall()
             return {row[0] for row in rows}
 
-async def add_car(country: str, description: str, photo_ids: list[str]) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
-        photo_ids_json = json.dumps(photo_ids)
+@timed
+async def get_chat_messages(chat_id: int, since: float, limit: int) -> list[tuple[int, float]]:
+    """Latest (message_id, sent_at) ledger entries of a chat sent after `since`."""
+    async with reader() as db:
+        async with db.execute('''
+            SELECT message_id, sent_at FROM chat_messages
+            WHERE chat_id = ? AND sent_at >= ?
+            ORDER BY message_id DESC LIMIT ?
+        ''', (chat_id, since, limit)) as cursor:
+            rows = await cursor.fetchall()
+            return [(row['message_id'], row['sent_at']) for row in rows]
+
+@timed
+async def save_chat_messages(added: list[tuple[int, int, float]], removed: list[tuple[int, int]], expire_before: float):
+    """Applies buffered ledger changes and drops entries too old to be deleted anyway."""
+    async with writer() as db:
+        if added:
+            await db.executemany('''
+                INSERT OR IGNORE INTO chat_messages (chat_id, message_id, sent_at)
+                VALUES (?, ?, ?)
+            ''', added)
+        if removed:
+            await db.executemany('DELETE FROM chat_messages WHERE chat_id = ? AND message_id = ?', removed)
+        await db.execute('DELETE FROM chat_messages WHERE sent_at < ?', (expire_before,))
+
+@timed
+async def add_car(country: str, description: str, photos: list[tuple[str, str | None]]) -> int:
+    """Inserts a car with its (file_id, file_unique_id) photos in the given order."""
+    async with writer() as db:
         cursor = await db.execute('''
-            INSERT INTO cars (country, description, photo_ids)
-            VALUES (?, ?, ?)
-        ''', (country, description, photo_ids_json))
+            INSERT INTO cars (country, description)
+            VALUES (?, ?)
+        ''', (country, description))
         car_id = cursor.lastrowid
-        await db.commit()
+        await db.executemany('''
+            INSERT INTO car_photos (car_id, position, file_id, file_unique_id)
+            VALUES (?, ?, ?, ?)
+        ''', [(car_id, position, file_id, unique_id) for position, (file_id, unique_id) in enumerate(photos)])
         return car_id
 
-async def get_cars_by_country(country: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute('SELECT * FROM cars WHERE country = ? ORDER BY id DESC', (country,)) as cursor:
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+@timed
+async def get_all_cars():
+    async with reader() as db:
+        async with db.execute('SELECT * FROM cars ORDER BY id') as cursor:
+            return await cursor.fetchall()
 
-async def get_car_by_id(car_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute('SELECT * FROM cars WHERE id = ?', (car_id,)) as cursor:
-            row = await cursor.fetchone()
-            return dict(row) if row else None
+@timed
+async def get_car_photos(car_ids: list[int] | None = None) -> dict[int, list[str]]:
+    """Returns {car_id: [file_id, ...]} in display order, for the given cars or all of them."""
+    async with reader() as db:
+        if car_ids is None:
+            query, params = 'SELECT car_id, file_id FROM car_photos ORDER BY car_id, position', ()
+        else:
+            placeholders = ",".join("?" for _ in car_ids)
+            query = f'SELECT car_id, file_id FROM car_photos WHERE car_id IN ({placeholders}) ORDER BY car_id, position'
+            params = tuple(car_ids)
+        photos: dict[int, list[str]] = {}
+        async with db.execute(query, params) as cursor:
+            async for row in cursor:
+                photos.setdefault(row['car_id'], []).append(row['file_id'])
+        return photos
 
+@timed
 async def delete_car(car_id: int) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with writer() as db:
         cursor = await db.execute('DELETE FROM cars WHERE id = ?', (car_id,))
-        await db.commit()
         return cursor.rowcount > 0
+
+@timed
+async def get_media_files() -> dict[str, tuple[int, int, str]]:
+    """Returns {path: (mtime_ns, size, file_id)} for every uploaded local file."""
+    async with reader() as db:
+        async with db.execute('SELECT path, mtime_ns, size, file_id FROM media_files') as cursor:
+            rows = await cursor.fetchall()
+            return {row['path']: (row['mtime_ns'], row['size'], row['file_id']) for row in rows}
+
+@timed
+async def save_media_file(path: str, mtime_ns: int, size: int, file_id: str):
+    async with writer() as db:
+        await db.execute('''
+            INSERT INTO media_files (path, mtime_ns, size, file_id)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+            mtime_ns=excluded.mtime_ns,
+            size=excluded.size,
+            file_id=excluded.file_id
+        ''', (path, mtime_ns, size, file_id))
+
+@timed
+async def save_analytics(counts: list[tuple[int, str, str, int]]):
+    """Adds (hour, event, key, count) rows to the hourly rollups."""
+    async with writer() as db:
+        await db.executemany('''
+            INSERT INTO analytics_hourly (hour, event, key, count)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(hour, event, key) DO UPDATE SET count = count + excluded.count
+        ''', counts)
+
+@timed
+async def get_analytics_totals(since_hour: int) -> list[tuple[str, str, int]]:
+    """(event, key, total) summed over the rollups from `since_hour` on."""
+    async with reader() as db:
+        async with db.execute('''
+            SELECT event, key, SUM(count) FROM analytics_hourly
+            WHERE hour >= ?
+            GROUP BY event, key
+        ''', (since_hour,)) as cursor:
+            return await cursor.fetchall()
+
+_PHONE_RUN = re.compile(r'\+?[\d()][\d\s()+-]*\d\)?')
+
+def _phone_term(run: str) -> str:
+    digits = re.sub(r'\D', '', run)
+    if digits.startswith('8'):
+        digits = '7' + digits[1:]
+    if digits.startswith('7') and len(digits) > 1:
+        # Stored numbers start with +7, 7 or 8; their last 10 digits are indexed too
+        return f'("{digits}"* OR "{digits[1:]}"*)'
+    return f'"{digits}"*'
+
+def to_fts_query(text: str) -> str | None:
+    """Turns free user input into a safe FTS5 prefix query ("иван" 7999 -> "иван"* AND "7999"*)."""
+    # Phones are indexed as bare digits, so "+7 (999) 123" is searched as one number. Only
+    # phone-like input is joined: all of it (7+ digits) or a run of 10+ digits within other
+    # words, so "Land Cruiser 200 2015" stays two numbers
+    whole = text.strip()
+    if re.fullmatch(r'[\d\s()+-]+', whole) and len(re.sub(r'\D', '', whole)) >= 7:
+        return _phone_term(whole)
+
+    terms = []
+    position = 0
+    for match in _PHONE_RUN.finditer(text):
+        if len(re.sub(r'\D', '', match.group())) < 10:
+            continue
+        terms += [f'"{term}"*' for term in re.findall(r'\w+', text[position:match.start()])]
+        terms.append(_phone_term(match.group()))
+        position = match.end()
+    terms += [f'"{term}"*' for term in re.findall(r'\w+', text[position:])]
+    if not terms:
+        return None
+    return ' AND '.join(terms)
+
+@timed
+async def search_requests(text: str, limit: int = 5, offset: int = 0):
+    """Requests matching `text` in fio, car_info or phone, best matches first."""
+    query = to_fts_query(text)
+    if query is None:
+        return []
+    async with reader() as db:
+        async with db.execute('''
+            SELECT r.*, u.username FROM requests_fts f
+            JOIN requests r ON r.id = f.rowid
+            LEFT JOIN users u ON u.id = r.user_id
+            WHERE requests_fts MATCH ?
+            ORDER BY f.rank
+            LIMIT ? OFFSET ?
+        ''', (query, limit, offset)) as cursor:
+            return await cursor.fetchall()
+
+@timed
+async def search_cars(text: str, limit: int = 5, offset: int = 0):
+    """Catalog cars whose description matches `text`, best matches first."""
+    query = to_fts_query(text)
+    if query is None:
+        return []
+    async with reader() as db:
+        async with db.execute('''
+            SELECT c.* FROM cars_fts f
+            JOIN cars c ON c.id = f.rowid
+            WHERE cars_fts MATCH ?
+            ORDER BY f.rank
+            LIMIT ? OFFSET ?
+        ''', (query, limit, offset)) as cursor:
+            return await cursor.fetchall()
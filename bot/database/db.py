@@ -1,57 +1,187 @@
+import asyncio
+import functools
+import inspect
+import time
 import aiosqlite
 import logging
+from contextlib import asynccontextmanager
+
+from bot.database.migrations import migrate
+from bot.utils.metrics import registry
 
 DB_PATH = 'data/bot_database.sqlite'
 
+# Number of read-only connections kept open next to the single writer
+READ_POOL_SIZE = 4
+
+# Applied once per connection when the pool is opened
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",   # ~16 MB page cache
+    "PRAGMA mmap_size=134217728", # 128 MB
+)
+
+_writer: aiosqlite.Connection | None = None
+_writer_lock = asyncio.Lock()
+_readers: asyncio.Queue | None = None
+_reader_conns: list[aiosqlite.Connection] = []
+
+QUERY_SECONDS = registry.histogram("bot_db_query_seconds", "Duration of bot.database.crud calls.", ("query",))
+QUERY_ERRORS = registry.counter("bot_db_query_errors_total", "bot.database.crud calls that raised.", ("query",))
+# One per reader()/writer() block, i.e. per statement or transaction that reached SQLite
+DB_CHECKOUTS = registry.counter("bot_db_checkouts_total", "Connections handed out by reader() and writer().", ("pool",))
+POOL_WAIT_SECONDS = registry.histogram(
+    "bot_db_pool_wait_seconds", "Time spent waiting for a pooled connection.", ("pool",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+
+async def _enable_incremental_vacuum(db: aiosqlite.Connection):
+    """
+    Lets the maintenance job give free pages back in small steps. A new file
+    takes the setting as is; an existing one needs a full VACUUM, once.
+    """
+    await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    async with db.execute("PRAGMA auto_vacuum") as cursor:
+        mode = (await cursor.fetchone())[0]
+    if mode != 2:
+        logging.info("Rebuilding the database file to enable incremental vacuum...")
+        await db.execute("VACUUM")
+
 async def init_db():
+    """Brings the schema up to date by applying pending migrations."""
     try:
         async with aiosqlite.connect(DB_PATH) as db:
-            # Users table
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    telegram_id INTEGER UNIQUE NOT NULL,
-                    fullname TEXT,
-                    username TEXT,
-                    join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    phone TEXT,
-                    role TEXT DEFAULT 'user' -- 'user', 'manager', 'admin'
-                )
-            ''')
-            
-            # Requests table
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS requests (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    fio TEXT NOT NULL,
-                    car_info TEXT NOT NULL,
-                    phone TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY(user_id) REFERENCES users(id)
-                )
-            ''')
-            
-            # Protected messages table
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS protected_messages (
-                    chat_id INTEGER,
-                    message_id INTEGER,
-                    PRIMARY KEY(chat_id, message_id)
-                )
-            ''')
-            
-            # Cars table
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS cars (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    country TEXT NOT NULL,
-                    description TEXT NOT NULL,
-                    photo_ids TEXT NOT NULL
-                )
-            ''')
-            
-            await db.commit()
-            logging.info("Database initialized successfully.")
+            version = await migrate(db)
+            # Before the pool opens, so the one-time rebuild never competes with the bot
+            await _enable_incremental_vacuum(db)
+            logging.info(f"Database initialized successfully (schema version {version}).")
     except Exception as e:
         logging.error(f"Failed to initialize database: {e}")
+        raise
+
+async def _connect(readonly: bool = False) -> aiosqlite.Connection:
+    if readonly:
+        conn = await aiosqlite.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    else:
+        conn = await aiosqlite.connect(DB_PATH)
+    conn.row_factory = aiosqlite.Row
+    for pragma in PRAGMAS:
+        if readonly and pragma.startswith("PRAGMA journal_mode"):
+            continue  # journal mode is a property of the file, set by the writer
+        await conn.execute(pragma)
+    return conn
+
+async def open_db(pool_size: int = READ_POOL_SIZE):
+    """Opens the shared writer connection and the read-only pool."""
+    global _writer, _readers
+    if _writer is not None:
+        return
+
+    _writer = await _connect()
+    _readers = asyncio.Queue()
+    for _ in range(pool_size):
+        conn = await _connect(readonly=True)
+        _reader_conns.append(conn)
+        _readers.put_nowait(conn)
+    logging.info(f"Database pool opened: 1 writer, {pool_size} readers.")
+
+async def close_db():
+    """Closes every pooled connection. Safe to call more than once."""
+    global _writer, _readers
+    if _writer is None:
+        return
+
+    async with _writer_lock:
+        for conn in _reader_conns:
+            await conn.close()
+        _reader_conns.clear()
+        _readers = None
+
+        conn, _writer = _writer, None
+        await conn.execute("PRAGMA optimize")
+        await conn.close()
+    logging.info("Database pool closed.")
+
+@asynccontextmanager
+async def reader():
+    """Borrows a read-only connection from the pool."""
+    DB_CHECKOUTS.inc(pool="reader")
+    if _readers is None:
+        # Pool not started (one-off scripts): fall back to a private connection
+        conn = await _connect()
+        try:
+            yield conn
+        finally:
+            await conn.close()
+        return
+
+    pool = _readers
+    started = time.perf_counter()
+    conn = await pool.get()
+    POOL_WAIT_SECONDS.observe(time.perf_counter() - started, pool="reader")
+    try:
+        yield conn
+    finally:
+        pool.put_nowait(conn)
+
+@asynccontextmanager
+async def writer():
+    """Exclusive access to the writer connection; commits on success, rolls back on error."""
+    DB_CHECKOUTS.inc(pool="writer")
+    if _writer is None:
+        conn = await _connect()
+        try:
+            yield conn
+            await conn.commit()
+        finally:
+            await conn.close()
+        return
+
+    started = time.perf_counter()
+    async with _writer_lock:
+        POOL_WAIT_SECONDS.observe(time.perf_counter() - started, pool="writer")
+        conn = _writer
+        try:
+            yield conn
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            raise
+
+def timed(func):
+    """Records the duration and failures of a query function under its name."""
+    name = func.__name__
+
+    if inspect.isasyncgenfunction(func):
+        # Generators are timed until exhausted, including the consumer's work
+        @functools.wraps(func)
+        async def gen_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            gen = func(*args, **kwargs)
+            try:
+                async for item in gen:
+                    yield item
+            except Exception:
+                QUERY_ERRORS.inc(query=name)
+                raise
+            finally:
+                # Close the inner generator right away so it hands its connection back
+                await gen.aclose()
+                QUERY_SECONDS.observe(time.perf_counter() - started, query=name)
+        return gen_wrapper
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            QUERY_ERRORS.inc(query=name)
+            raise
+        finally:
+            QUERY_SECONDS.observe(time.perf_counter() - started, query=name)
+    return wrapper
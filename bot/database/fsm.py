@@ -0,0 +1,184 @@
+import asyncio
+import contextlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from bot.database.db import reader, writer
+
+def _key(key: StorageKey) -> str:
+    return ":".join(str(part) for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id,
+        key.business_connection_id, key.destiny,
+    ))
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM storage persisted in the fsm_states table.
+
+    Hot records live in a bounded LRU in memory; changes are written behind
+    in batches every `flush_interval` seconds and on close(). Records idle
+    for `idle_ttl` leave memory; records untouched for `state_ttl` are
+    treated as abandoned surveys and purged from the database too.
+    """
+
+    def __init__(self, maxsize: int = 5_000, idle_ttl: float = 1800,
+                 state_ttl: float = 7 * 24 * 3600, flush_interval: float = 1.0,
+                 expire_interval: float = 600):
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self.state_ttl = state_ttl
+        self.flush_interval = flush_interval
+        self.expire_interval = expire_interval
+        # key -> [state, data, last_access]
+        self._cache: OrderedDict[str, list] = OrderedDict()
+        # key -> (state, data, updated_at) waiting to be written
+        self._dirty: dict[str, tuple[str | None, dict, float]] = {}
+        # key -> load in progress; concurrent misses share it instead of each building a record
+        self._loading: dict[str, asyncio.Task] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def size(self) -> int:
+        """Number of records held in memory."""
+        return len(self._cache)
+
+    @property
+    def pending(self) -> int:
+        """Number of changed records not yet written."""
+        return len(self._dirty)
+
+    def _remember(self, k: str, record: list) -> list:
+        self._cache[k] = record
+        while len(self._cache) > self.maxsize:
+            # Dirty snapshots survive eviction until the next flush
+            self._cache.popitem(last=False)
+        return record
+
+    async def _load(self, k: str) -> list:
+        try:
+            async with reader() as db:
+                async with db.execute('SELECT state, data, updated_at FROM fsm_states WHERE key = ?', (k,)) as cursor:
+                    row = await cursor.fetchone()
+        finally:
+            del self._loading[k]
+
+        # A change made meanwhile through a cached record or the dirty map wins over the row
+        record = self._cache.get(k)
+        if record is not None:
+            return record
+        pending = self._dirty.get(k)
+        if pending is not None:
+            return self._remember(k, [pending[0], dict(pending[1]), time.monotonic()])
+        if row and row['updated_at'] >= time.time() - self.state_ttl:
+            return self._remember(k, [row['state'], json.loads(row['data']), time.monotonic()])
+        return self._remember(k, [None, {}, time.monotonic()])
+
+    async def _record(self, key: StorageKey) -> list:
+        k = _key(key)
+        record = self._cache.get(k)
+        if record is not None:
+            self._cache.move_to_end(k)
+            record[2] = time.monotonic()
+            return record
+
+        pending = self._dirty.get(k)
+        if pending is not None:
+            return self._remember(k, [pending[0], dict(pending[1]), time.monotonic()])
+
+        task = self._loading.get(k)
+        if task is None:
+            task = self._loading[k] = asyncio.create_task(self._load(k))
+        # Shielded, so one cancelled caller does not fail the others
+        return await asyncio.shield(task)
+
+    def _mark_dirty(self, key: StorageKey, record: list):
+        self._dirty[_key(key)] = (record[0], dict(record[1]), time.time())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record[0] = state.state if isinstance(state, State) else state
+        self._mark_dirty(key, record)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._record(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+        record = await self._record(key)
+        record[1] = data.copy()
+        self._mark_dirty(key, record)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return (await self._record(key))[1].copy()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            batch, self._dirty = self._dirty, {}
+
+            upserts = [
+                (k, state, json.dumps(data, ensure_ascii=False), updated_at)
+                for k, (state, data, updated_at) in batch.items()
+                if state is not None or data
+            ]
+            deletes = [(k,) for k, (state, data, _) in batch.items() if state is None and not data]
+            try:
+                async with writer() as db:
+                    if upserts:
+                        await db.executemany('''
+                            INSERT INTO fsm_states (key, state, data, updated_at)
+                            VALUES (?, ?, ?, ?)
+                            ON CONFLICT(key) DO UPDATE SET
+                            state=excluded.state,
+                            data=excluded.data,
+                            updated_at=excluded.updated_at
+                        ''', upserts)
+                    if deletes:
+                        await db.executemany('DELETE FROM fsm_states WHERE key = ?', deletes)
+            except Exception:
+                self._dirty = {**batch, **self._dirty}
+                raise
+
+    async def expire(self):
+        """Drops idle records from memory and abandoned ones from the database."""
+        idle_before = time.monotonic() - self.idle_ttl
+        for k in [k for k, record in self._cache.items() if record[2] < idle_before]:
+            del self._cache[k]
+
+        async with writer() as db:
+            await db.execute('DELETE FROM fsm_states WHERE updated_at < ?', (time.time() - self.state_ttl,))
+
+    async def _every(self, interval: float, job):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await job()
+            except Exception as e:
+                logging.error(f"FSM storage {job.__name__} failed: {e}")
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._every(self.flush_interval, self.flush)),
+                asyncio.create_task(self._every(self.expire_interval, self.expire)),
+            ]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+        await self.flush()
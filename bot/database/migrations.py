@@ -0,0 +1,248 @@
+import json
+import logging
+import aiosqlite
+
+def _fts_phone(column: str) -> str:
+    """SQL expression with the digits of a phone column, in full and as the last 10."""
+    digits = column
+    for ch in " -()+":
+        digits = f"replace({digits}, '{ch}', '')"
+    return f"{digits} || ' ' || substr({digits}, -10)"
+
+async def _move_car_photos(db: aiosqlite.Connection):
+    """Copies the JSON list in cars.photo_ids into car_photos, keeping the order."""
+    async with db.execute("SELECT id, photo_ids FROM cars") as cursor:
+        rows = await cursor.fetchall()
+    photos = []
+    for car_id, photo_ids in rows:
+        try:
+            file_ids = json.loads(photo_ids or "[]")
+        except ValueError:
+            logging.warning(f"Car {car_id} has unreadable photo_ids, skipping its photos")
+            continue
+        photos += [(car_id, position, file_id) for position, file_id in enumerate(file_ids)]
+    await db.executemany("INSERT INTO car_photos (car_id, position, file_id) VALUES (?, ?, ?)", photos)
+
+# Ordered list of (version, name, steps). A step is an SQL string or an
+# `async def step(db)` for data migrations. Append only: never edit a
+# migration that has already shipped, add a new one instead.
+MIGRATIONS = [
+    (1, "initial schema", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER UNIQUE NOT NULL,
+            fullname TEXT,
+            username TEXT,
+            join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            phone TEXT,
+            role TEXT DEFAULT 'user' -- 'user', 'manager', 'admin'
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            fio TEXT NOT NULL,
+            car_info TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS protected_messages (
+            chat_id INTEGER,
+            message_id INTEGER,
+            PRIMARY KEY(chat_id, message_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS cars (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            country TEXT NOT NULL,
+            description TEXT NOT NULL,
+            photo_ids TEXT NOT NULL
+        )
+        ''',
+    ]),
+    (2, "hot path indexes", [
+        # assign_manager / remove_manager by username
+        "CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)",
+        # get_all_admins_and_managers / get_all_managers
+        "CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)",
+        # get_all_users
+        "CREATE INDEX IF NOT EXISTS idx_users_join_date ON users(join_date)",
+        "CREATE INDEX IF NOT EXISTS idx_cars_country_id ON cars(country, id)",
+        "CREATE INDEX IF NOT EXISTS idx_requests_user_id ON requests(user_id)",
+    ]),
+    (3, "telegram file_id cache for local media", [
+        '''
+        CREATE TABLE IF NOT EXISTS media_files (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            file_id TEXT NOT NULL
+        )
+        ''',
+    ]),
+    (4, "persistent FSM storage", [
+        '''
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at REAL NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states(updated_at)",
+    ]),
+    (5, "sent message ledger", [
+        '''
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            sent_at REAL NOT NULL,
+            PRIMARY KEY(chat_id, message_id)
+        ) WITHOUT ROWID
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_chat_messages_sent_at ON chat_messages(sent_at)",
+    ]),
+    (6, "keyset index for the admin user browser", [
+        "CREATE INDEX IF NOT EXISTS idx_users_join_date_id ON users(join_date, id)",
+        # Superseded by idx_users_join_date_id
+        "DROP INDEX IF EXISTS idx_users_join_date",
+    ]),
+    (7, "full-text search over requests and cars", [
+        # Phones are indexed as bare digits (full and last 10) so "79991234567"
+        # and "9991234567" both match "+7 (999) 123-45-67"
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS requests_fts USING fts5(
+            fio, car_info, phone,
+            content='requests', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS requests_fts_ai AFTER INSERT ON requests BEGIN
+            INSERT INTO requests_fts(rowid, fio, car_info, phone) VALUES (new.id, new.fio, new.car_info, {_fts_phone("new.phone")});
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS requests_fts_ad AFTER DELETE ON requests BEGIN
+            INSERT INTO requests_fts(requests_fts, rowid, fio, car_info, phone) VALUES ('delete', old.id, old.fio, old.car_info, {_fts_phone("old.phone")});
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS requests_fts_au AFTER UPDATE ON requests BEGIN
+            INSERT INTO requests_fts(requests_fts, rowid, fio, car_info, phone) VALUES ('delete', old.id, old.fio, old.car_info, {_fts_phone("old.phone")});
+            INSERT INTO requests_fts(rowid, fio, car_info, phone) VALUES (new.id, new.fio, new.car_info, {_fts_phone("new.phone")});
+        END
+        ''',
+        f"INSERT INTO requests_fts(rowid, fio, car_info, phone) SELECT id, fio, car_info, {_fts_phone('phone')} FROM requests",
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS cars_fts USING fts5(
+            description,
+            content='cars', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS cars_fts_ai AFTER INSERT ON cars BEGIN
+            INSERT INTO cars_fts(rowid, description) VALUES (new.id, new.description);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS cars_fts_ad AFTER DELETE ON cars BEGIN
+            INSERT INTO cars_fts(cars_fts, rowid, description) VALUES ('delete', old.id, old.description);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS cars_fts_au AFTER UPDATE ON cars BEGIN
+            INSERT INTO cars_fts(cars_fts, rowid, description) VALUES ('delete', old.id, old.description);
+            INSERT INTO cars_fts(rowid, description) VALUES (new.id, new.description);
+        END
+        ''',
+        "INSERT INTO cars_fts(cars_fts) VALUES ('rebuild')",
+    ]),
+    (8, "normalized car photos", [
+        '''
+        CREATE TABLE IF NOT EXISTS car_photos (
+            car_id INTEGER NOT NULL REFERENCES cars(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            file_id TEXT NOT NULL,
+            file_unique_id TEXT,
+            PRIMARY KEY (car_id, position)
+        ) WITHOUT ROWID
+        ''',
+        # "Is this photo already in the catalog?" without scanning every car
+        "CREATE INDEX IF NOT EXISTS idx_car_photos_file_unique_id ON car_photos(file_unique_id)",
+        _move_car_photos,
+        "ALTER TABLE cars DROP COLUMN photo_ids",
+    ]),
+    (9, "idempotent lead intake", [
+        # Set by the lead queue so a lead replayed from its journal is inserted once
+        "ALTER TABLE requests ADD COLUMN lead_key TEXT",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_requests_lead_key ON requests(lead_key) WHERE lead_key IS NOT NULL",
+    ]),
+    (10, "hourly analytics rollups", [
+        # One row per hour and counted thing; reports scan hours, never raw events
+        '''
+        CREATE TABLE IF NOT EXISTS analytics_hourly (
+            hour INTEGER NOT NULL,  -- unix time of the start of the hour, UTC
+            event TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (hour, event, key)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (11, "retention and request archive", [
+        # Rows already there are of unknown age; let them expire one horizon from now
+        "ALTER TABLE protected_messages ADD COLUMN created_at REAL NOT NULL DEFAULT 0",
+        "UPDATE protected_messages SET created_at = CAST(strftime('%s', 'now') AS REAL)",
+        "CREATE INDEX IF NOT EXISTS idx_protected_messages_created_at ON protected_messages(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_requests_created_at ON requests(created_at)",
+        '''
+        CREATE TABLE IF NOT EXISTS requests_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            fio TEXT NOT NULL,
+            car_info TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            created_at TIMESTAMP,
+            lead_key TEXT,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+]
+
+async def get_schema_version(db: aiosqlite.Connection) -> int:
+    async with db.execute("PRAGMA user_version") as cursor:
+        row = await cursor.fetchone()
+        return row[0]
+
+async def migrate(db: aiosqlite.Connection, migrations=MIGRATIONS) -> int:
+    """Applies every migration newer than PRAGMA user_version, each in its own transaction."""
+    current = await get_schema_version(db)
+    for version, name, steps in sorted(migrations, key=lambda m: m[0]):
+        if version <= current:
+            continue
+
+        logging.info(f"Applying migration {version}: {name}")
+        await db.execute("BEGIN")
+        try:
+            for step in steps:
+                if isinstance(step, str):
+                    await db.execute(step)
+                else:
+                    await step(db)
+            # PRAGMA does not accept bound parameters; version is an int from this module
+            await db.execute(f"PRAGMA user_version = {int(version)}")
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        current = version
+    return current
@@ -0,0 +1,34 @@
+from dataclasses import dataclass
+
+STAFF_ROLES = ('admin', 'manager')
+
+@dataclass(frozen=True, slots=True)
+class User:
+    """A row of the users table as seen by handlers."""
+    id: int
+    telegram_id: int
+    fullname: str | None
+    username: str | None
+    phone: str | None
+    role: str
+    join_date: str | None = None
+
+    @classmethod
+    def from_row(cls, row) -> "User":
+        return cls(
+            id=row['id'],
+            telegram_id=row['telegram_id'],
+            fullname=row['fullname'],
+            username=row['username'],
+            phone=row['phone'],
+            role=row['role'] or 'user',
+            join_date=row['join_date'],
+        )
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == 'admin'
+
+    @property
+    def is_staff(self) -> bool:
+        return self.role in STAFF_ROLES
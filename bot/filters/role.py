@@ -0,0 +1,16 @@
+from aiogram.filters import BaseFilter
+from aiogram.types import TelegramObject
+
+from bot.database.models import User
+
+class IsStaff(BaseFilter):
+    """Passes for admins and managers. Relies on `user` injected by UserMiddleware."""
+
+    async def __call__(self, event: TelegramObject, user: User | None = None) -> bool:
+        return user is not None and user.is_staff
+
+class IsAdmin(BaseFilter):
+    """Passes for admins only."""
+
+    async def __call__(self, event: TelegramObject, user: User | None = None) -> bool:
+        return user is not None and user.is_admin
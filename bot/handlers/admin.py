@@ -1,66 +1,258 @@
+import html
+import os
+from datetime import datetime
+
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, ContentType
+from aiogram.filters import Command, CommandObject
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, CallbackQuery, ContentType, FSInputFile, InputMediaDocument
 from aiogram.fsm.context import FSMContext
 
-from bot.database.crud import get_all_users, assign_manager, get_user_by_tg_id, add_car, delete_car, get_all_managers, remove_manager
-from bot.keyboards.inline import get_admin_inline_keyboard, get_admin_add_car_country_keyboard
+from bot.database.crud import get_users_page, assign_manager, get_all_managers, remove_manager, search_requests, search_cars
+from bot.database.models import User
+from bot.filters.role import IsAdmin, IsStaff
+from bot.services.albums import album_collector
+from bot.services.analytics import FUNNELS, analytics
+from bot.services.backup import backup_manager
+from bot.services.catalog import car_catalog
+from bot.services.export import export_users, export_requests
+from bot.keyboards.inline import (
+    get_admin_inline_keyboard, get_admin_add_car_country_keyboard,
+    get_users_browser_keyboard, USER_ROLE_FILTERS, USER_PHONE_FILTERS, get_search_results_keyboard,
+    STATS_PERIODS, get_stats_keyboard,
+)
 from bot.keyboards.reply import get_cancel_keyboard, get_main_keyboard, get_finish_photos_keyboard
 from bot.states.calc import AdminStates, AdminAddCarStates
 
-router = Router()
-
-async def ensure_admin_or_manager(telegram_id: int):
-    user = await get_user_by_tg_id(telegram_id)
-    if user and user['role'] in ('admin', 'manager'):
-        return True
-    return False
+router = Router(name="admin")
 
 @router.message(F.text == "Панель администратора")
-async def admin_panel(message: Message):
-    user = await get_user_by_tg_id(message.from_user.id)
-    if not user or user['role'] not in ('admin', 'manager'):
+async def admin_panel(message: Message, user: User):
+    if not user or not user.is_staff:
         await message.answer("У вас нет доступа к этой команде.")
         return
         
-    is_admin = user['role'] == 'admin'
-    await message.answer("Панель администратора. Выберите действие:", reply_markup=get_admin_inline_keyboard(is_admin))
+    await message.answer("Панель администратора. Выберите действие:", reply_markup=get_admin_inline_keyboard(user.is_admin))
+
+async def edit_in_place(callback: CallbackQuery, text: str, reply_markup):
+    """Edits the paged message; tapping the current page again is not an error."""
+    try:
+        await callback.message.edit_text(text, reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in e.message:
+            raise
+
+USERS_PAGE_SIZE = 10
+
+async def render_users_page(role: str = "all", phone: str = "any", cursor_id: int | None = None, direction: str = "next"):
+    """Returns (text, keyboard) for one page of the user browser."""
+    users, has_prev, has_next = await get_users_page(
+        cursor_id, direction,
+        role=None if role == "all" else role,
+        has_phone={"any": None, "yes": True, "no": False}[phone],
+        limit=USERS_PAGE_SIZE
+    )
+    if not users:
+        msg = "Список пользователей пуст."
+    else:
+        msg = "Список пользователей:\n\n"
+        for u in users:
+            phone_text = html.escape(u['phone']) if u['phone'] else 'Нет'
+            username = f"@{html.escape(u['username'])}" if u['username'] else "Нет"
+            msg += (f"Имя: {html.escape(u['fullname'] or '')} | Ник: {username} | Тел: {phone_text} | "
+                    f"Дата: {u['join_date'][:10]} | Роль: {u['role']}\n")
 
-@router.callback_query(F.data == "admin_users")
+    first_id = users[0]['id'] if users else None
+    last_id = users[-1]['id'] if users else None
+    return msg, get_users_browser_keyboard(role, phone, first_id, last_id, has_prev, has_next)
+
+@router.callback_query(F.data == "admin_users", IsStaff())
 async def admin_list_users(callback: CallbackQuery):
-    if not await ensure_admin_or_manager(callback.from_user.id):
+    msg, keyboard = await render_users_page()
+    await callback.message.answer(msg, reply_markup=keyboard)
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("usr_"), IsStaff())
+async def admin_users_page(callback: CallbackQuery):
+    _, role, phone, direction, cursor_id = callback.data.split("_")
+    if role not in USER_ROLE_FILTERS or phone not in USER_PHONE_FILTERS:
+        await callback.answer()
         return
-        
-    users = await get_all_users()
-    if not users:
-        await callback.message.answer("Список пользователей пуст.")
+
+    msg, keyboard = await render_users_page(role, phone, int(cursor_id) or None, direction)
+    await edit_in_place(callback, msg, keyboard)
+    await callback.answer()
+
+@router.callback_query(F.data == "admin_export", IsStaff())
+async def admin_export(callback: CallbackQuery):
+    await callback.answer("Готовим выгрузку...")
+    paths = []
+    try:
+        paths.append(await export_users())
+        paths.append(await export_requests())
+        stamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
+        await callback.message.answer_media_group([
+            InputMediaDocument(media=FSInputFile(paths[0], filename=f"users_{stamp}.csv"), caption="Пользователи"),
+            InputMediaDocument(media=FSInputFile(paths[1], filename=f"requests_{stamp}.csv"), caption="Заявки"),
+        ])
+    finally:
+        for path in paths:
+            os.remove(path)
+
+# Bot API limit for documents sent by a bot
+BACKUP_UPLOAD_LIMIT = 50 * 1024 * 1024
+
+async def send_backup(message: Message):
+    await message.answer("Создаем резервную копию базы...")
+    try:
+        path = await backup_manager.snapshot()
+    except Exception as e:
+        await message.answer(f"Не удалось создать резервную копию: {html.escape(str(e))}")
         return
-        
-    msg = "Список пользователей:\n\n"
-    for idx, u in enumerate(users[:50]): # Limit to latest 50 for telegram message size limits
-        phone = u['phone'] if u['phone'] else 'Нет'
-        username = f"@{u['username']}" if u['username'] else "Нет"
-        msg += f"{idx+1}. Имя: {u['fullname']} | Ник: {username} | Тел: {phone} | Дата: {u['join_date'][:10]} | Роль: {u['role']}\n"
-    
-    await callback.message.answer(msg)
+
+    size = os.path.getsize(path)
+    if size > BACKUP_UPLOAD_LIMIT:
+        await message.answer(f"Копия сохранена на сервере, но слишком велика для отправки ({size // 1024 // 1024} МБ):\n"
+                             f"<code>{html.escape(path)}</code>")
+        return
+    await message.answer_document(FSInputFile(path), caption=f"Резервная копия базы, {size // 1024} КБ")
+
+@router.callback_query(F.data == "admin_backup", IsAdmin())
+async def admin_backup(callback: CallbackQuery):
     await callback.answer()
+    await send_backup(callback.message)
 
-@router.callback_query(F.data == "admin_assign_manager")
-async def start_assign_manager(callback: CallbackQuery, state: FSMContext):
-    if not await ensure_admin_or_manager(callback.from_user.id):
+@router.message(Command("backup"), IsAdmin())
+async def cmd_backup(message: Message):
+    await send_backup(message)
+
+SEARCH_PAGE_SIZE = 5
+
+async def render_search_page(query: str, page: int):
+    """Returns (text, keyboard) for one page of ranked search results."""
+    offset = page * SEARCH_PAGE_SIZE
+    # Fetch one extra row per section to know whether there is a next page
+    requests = await search_requests(query, SEARCH_PAGE_SIZE + 1, offset)
+    cars = await search_cars(query, SEARCH_PAGE_SIZE + 1, offset)
+    has_next = len(requests) > SEARCH_PAGE_SIZE or len(cars) > SEARCH_PAGE_SIZE
+
+    msg = f"Результаты поиска «{html.escape(query)}» (стр. {page + 1}):\n\n"
+    if requests[:SEARCH_PAGE_SIZE]:
+        msg += "<b>Заявки:</b>\n"
+        for r in requests[:SEARCH_PAGE_SIZE]:
+            username = f"@{html.escape(r['username'])}" if r['username'] else "Нет"
+            msg += (f"#{r['id']} {r['created_at'][:10]} | {html.escape(r['fio'])} | "
+                    f"{html.escape(r['car_info'][:80])} | Тел: {html.escape(r['phone'])} | Ник: {username}\n")
+        msg += "\n"
+    if cars[:SEARCH_PAGE_SIZE]:
+        msg += "<b>Авто из подборок:</b>\n"
+        for c in cars[:SEARCH_PAGE_SIZE]:
+            msg += f"#{c['id']} {c['country']}: {html.escape(c['description'][:100])}\n"
+    if not requests and not cars:
+        msg += "Ничего не найдено."
+    return msg, get_search_results_keyboard(page, has_next)
+
+@router.callback_query(F.data == "admin_search", IsStaff())
+async def start_search(callback: CallbackQuery, state: FSMContext):
+    await callback.message.answer("Введите ФИО, телефон, марку или модель для поиска:", reply_markup=get_cancel_keyboard())
+    await state.set_state(AdminStates.waiting_for_search_query)
+    await callback.answer()
+
+async def run_search(message: Message, state: FSMContext, user: User, query: str):
+    # Keep the query in FSM data for paging, without holding the user in a state
+    await state.set_state(None)
+    await state.update_data(search_query=query)
+    msg, keyboard = await render_search_page(query, 0)
+    await message.answer(msg, reply_markup=keyboard)
+    await message.answer("Выберите действие:", reply_markup=get_main_keyboard(user.is_staff))
+
+@router.message(AdminStates.waiting_for_search_query, F.text)
+async def process_search_query(message: Message, state: FSMContext, user: User):
+    if message.text == "Отменить":
+        await state.clear()
         return
-        
+    await run_search(message, state, user, message.text.strip())
+
+@router.message(Command("search"), IsStaff())
+async def cmd_search(message: Message, command: CommandObject, state: FSMContext, user: User):
+    if not command.args:
+        await message.answer("Использование: /search ФИО, телефон или модель")
+        return
+    await run_search(message, state, user, command.args.strip())
+
+@router.callback_query(F.data.startswith("srch_"), IsStaff())
+async def search_page(callback: CallbackQuery, state: FSMContext):
+    query = (await state.get_data()).get("search_query")
+    if not query:
+        await callback.answer("Поиск устарел, начните заново.", show_alert=True)
+        return
+
+    msg, keyboard = await render_search_page(query, int(callback.data.split("_")[1]))
+    await edit_in_place(callback, msg, keyboard)
+    await callback.answer()
+
+STATS_COUNTRIES = {"japan": "Япония", "korea": "Корея", "china": "Китай"}
+STATS_TOP_CARS = 5
+
+async def render_stats(days: int) -> str:
+    """Report over the hourly rollups; its cost depends on the period, not on traffic."""
+    totals = await analytics.totals(days)
+    steps = totals.get("step", {})
+
+    msg = f"<b>Статистика за {days} дн.</b>\n"
+    for title, funnel in FUNNELS.values():
+        msg += f"\n<b>{title}:</b>\n"
+        first = steps.get(funnel[0][0], 0)
+        for key, label in funnel:
+            count = steps.get(key, 0)
+            share = f" ({count * 100 // first}%)" if first else ""
+            msg += f"{label}: {count}{share}\n"
+
+    countries, pages = totals.get("country", {}), totals.get("country_page", {})
+    msg += "\n<b>Подборки авто (открытия / листания):</b>\n"
+    for country, name in STATS_COUNTRIES.items():
+        msg += f"{name}: {countries.get(country, 0)} / {pages.get(country, 0)}\n"
+
+    photos, orders = totals.get("car_photos", {}), totals.get("car_order", {})
+    top = sorted(set(photos) | set(orders), key=lambda car_id: (orders.get(car_id, 0), photos.get(car_id, 0)),
+                 reverse=True)[:STATS_TOP_CARS]
+    if top:
+        msg += "\n<b>Популярные авто (заказы / фото):</b>\n"
+        for car_id in top:
+            car = await car_catalog.get(int(car_id))
+            description = html.escape(car.description[:60]) if car else "удален"
+            msg += f"#{car_id} {description}: {orders.get(car_id, 0)} / {photos.get(car_id, 0)}\n"
+    return msg
+
+@router.callback_query(F.data.startswith("stats_"), IsStaff())
+async def admin_stats(callback: CallbackQuery):
+    days = int(callback.data.split("_")[1])
+    if days not in STATS_PERIODS:
+        await callback.answer()
+        return
+
+    msg, keyboard = await render_stats(days), get_stats_keyboard(days)
+    # The period buttons edit the report in place; the panel button sends a new one
+    if callback.message.text and callback.message.text.startswith("Статистика за"):
+        await edit_in_place(callback, msg, keyboard)
+    else:
+        await callback.message.answer(msg, reply_markup=keyboard)
+    await callback.answer()
+
+@router.callback_query(F.data == "admin_assign_manager", IsStaff())
+async def start_assign_manager(callback: CallbackQuery, state: FSMContext):
     await callback.message.answer("Введите Telegram ID или Username (без @) пользователя которого хотите назначить менеджером:", reply_markup=get_cancel_keyboard())
     await state.set_state(AdminStates.waiting_for_manager_id)
     await callback.answer()
 
 @router.message(AdminStates.waiting_for_manager_id, F.text)
-async def process_assign_manager(message: Message, state: FSMContext):
+async def process_assign_manager(message: Message, state: FSMContext, user: User):
     if message.text == "Отменить":
         await state.clear()
         return
 
     success = await assign_manager(message.text.strip())
-    main_kb = await get_main_keyboard(message.from_user.id)
+    main_kb = get_main_keyboard(user.is_staff)
     
     if success:
         await message.answer(f"Пользователь {message.text} успешно назначен менеджером!", reply_markup=main_kb)
@@ -70,9 +262,8 @@ async def process_assign_manager(message: Message, state: FSMContext):
     await state.clear()
 
 @router.callback_query(F.data == "admin_remove_manager")
-async def start_remove_manager(callback: CallbackQuery, state: FSMContext):
-    user = await get_user_by_tg_id(callback.from_user.id)
-    if not user or user['role'] != 'admin':
+async def start_remove_manager(callback: CallbackQuery, state: FSMContext, user: User):
+    if not user or not user.is_admin:
         await callback.answer("У вас нет доступа к этой команде.", show_alert=True)
         return
         
@@ -95,15 +286,15 @@ async def start_remove_manager(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 @router.message(AdminStates.waiting_for_remove_manager_id, F.text)
-async def process_remove_manager(message: Message, state: FSMContext):
+async def process_remove_manager(message: Message, state: FSMContext, user: User):
     if message.text == "Отменить":
         await state.clear()
-        main_kb = await get_main_keyboard(message.from_user.id)
+        main_kb = get_main_keyboard(user.is_staff)
         await message.answer("Действие отменено.", reply_markup=main_kb)
         return
 
     success = await remove_manager(message.text.strip())
-    main_kb = await get_main_keyboard(message.from_user.id)
+    main_kb = get_main_keyboard(user.is_staff)
     
     if success:
         await message.answer(f"Пользователь {message.text} успешно удален из менеджеров!", reply_markup=main_kb)
@@ -112,11 +303,8 @@ async def process_remove_manager(message: Message, state: FSMContext):
         
     await state.clear()
 
-@router.callback_query(F.data == "admin_add_car")
+@router.callback_query(F.data == "admin_add_car", IsStaff())
 async def admin_add_car(callback: CallbackQuery, state: FSMContext):
-    if not await ensure_admin_or_manager(callback.from_user.id):
-        return
-        
     await callback.message.answer("Выберите страну для подборки:", reply_markup=get_admin_add_car_country_keyboard())
     await state.set_state(AdminAddCarStates.waiting_for_country)
     await callback.answer()
@@ -142,16 +330,26 @@ async def process_add_car_country(callback: CallbackQuery, state: FSMContext):
 
 @router.message(AdminAddCarStates.waiting_for_photos, F.photo)
 async def process_add_car_photos(message: Message, state: FSMContext):
-    data = await state.get_data()
-    photos = data.get("photos", [])
-    
-    file_id = message.photo[-1].file_id
-    photos.append(file_id)
-    
-    await state.update_data(photos=photos)
+    async def commit(messages: list[Message]):
+        # The admin may have cancelled while the album was still arriving
+        if await state.get_state() != AdminAddCarStates.waiting_for_photos.state:
+            return
+        data = await state.get_data()
+        # [file_id, file_unique_id] pairs; plain file ids come from states saved before albums were batched
+        photos = [p if isinstance(p, list) else [p, None] for p in data.get("photos", [])]
+        seen = {unique_id for _, unique_id in photos if unique_id}
+        for msg in messages:
+            photo = msg.photo[-1]
+            if photo.file_unique_id not in seen:
+                seen.add(photo.file_unique_id)
+                photos.append([photo.file_id, photo.file_unique_id])
+        await state.update_data(photos=photos)
+
+    album_collector.collect(message, commit)
     
 @router.message(AdminAddCarStates.waiting_for_photos, F.text == "Завершить отправку фото")
 async def process_finish_photos(message: Message, state: FSMContext):
+    await album_collector.flush(message.chat.id)
     data = await state.get_data()
     photos = data.get("photos", [])
     
@@ -164,37 +362,37 @@ async def process_finish_photos(message: Message, state: FSMContext):
 
 @router.message(AdminAddCarStates.waiting_for_photos, F.text == "Отменить")
 @router.message(AdminAddCarStates.waiting_for_description, F.text == "Отменить")
-async def process_cancel_add_car(message: Message, state: FSMContext):
+async def process_cancel_add_car(message: Message, state: FSMContext, user: User):
     await state.clear()
-    main_kb = await get_main_keyboard(message.from_user.id)
+    main_kb = get_main_keyboard(user.is_staff)
     await message.answer("Добавление автомобиля отменено.", reply_markup=main_kb)
 
 @router.message(AdminAddCarStates.waiting_for_description, F.text)
-async def process_add_car_description(message: Message, state: FSMContext):
+async def process_add_car_description(message: Message, state: FSMContext, user: User):
     if message.text == "Отменить":
-        await process_cancel_add_car(message, state)
+        await process_cancel_add_car(message, state, user)
         return
 
     data = await state.get_data()
     country = data.get("country")
-    photos = data.get("photos")
+    photos = [p if isinstance(p, list) else [p, None] for p in data.get("photos", [])]
     description = message.text
     
-    await add_car(country, description, photos)
+    await car_catalog.add_car(country, description, photos)
     
     await state.clear()
-    main_kb = await get_main_keyboard(message.from_user.id)
+    main_kb = get_main_keyboard(user.is_staff)
     await message.answer("Автомобиль успешно добавлен в подборку!", reply_markup=main_kb)
 
 @router.callback_query(F.data.startswith("delete_car_"))
-async def process_delete_car(callback: CallbackQuery):
-    if not await ensure_admin_or_manager(callback.from_user.id):
+async def process_delete_car(callback: CallbackQuery, user: User):
+    if not user or not user.is_staff:
         await callback.answer("У вас нет прав для этого действия", show_alert=True)
         return
         
     try:
         car_id = int(callback.data.split("_")[2])
-        success = await delete_car(car_id)
+        success = await car_catalog.delete_car(car_id)
         
         if success:
             await callback.message.answer("Автомобиль успешно удален.")
@@ -0,0 +1,165 @@
+import math
+
+from aiogram import Router, F
+from aiogram.types import Message, CallbackQuery
+from aiogram.fsm.context import FSMContext
+
+from bot.states.calc import EstimateStates
+from bot.database.models import User
+from bot.keyboards.inline import get_estimate_country_keyboard, get_estimate_result_keyboard
+from bot.keyboards.reply import get_cancel_keyboard
+from bot.handlers.survey import start_survey
+from bot.services.analytics import CALC_ESTIMATE, analytics
+from bot.services.calculator import (
+    COUNTRY_CURRENCIES, CostBreakdown, EstimateInput, age_from_input, calculator
+)
+
+router = Router(name="calculator")
+
+COUNTRY_NAMES = {"japan": "Япония", "korea": "Корея", "china": "Китай"}
+
+# Far above any real car price in every supported currency (about 10 billion RUB in KRW)
+MAX_PRICE = 1e11
+
+def parse_number(text: str) -> float | None:
+    """Parses "1 250 000", "1,6" or "2.0"; None if it is not a positive finite number."""
+    text = text.replace(" ", "").replace("\u00a0", "").replace(",", ".")
+    try:
+        value = float(text)
+    except ValueError:
+        return None
+    # float() also takes "inf", "nan" and "1e400"
+    return value if math.isfinite(value) and value > 0 else None
+
+def format_amount(amount: float) -> str:
+    return f"{amount:,.0f}".replace(",", " ")
+
+def format_rub(amount: float) -> str:
+    return f"{format_amount(amount)} ₽"
+
+def format_estimate(item: EstimateInput, cost: CostBreakdown) -> str:
+    currency = COUNTRY_CURRENCIES[item.country]
+    return (
+        f"<b>Расчет стоимости: {COUNTRY_NAMES[item.country]}</b>\n"
+        f"Цена: {format_amount(item.price)} {currency}\n"
+        f"Двигатель: {item.engine_cc} см³, {item.power_hp} л.с., возраст: {item.age_years} г.\n\n"
+        f"Цена авто: {format_rub(cost.price)}\n"
+        f"Расходы в стране покупки: {format_rub(cost.local_fees)}\n"
+        f"Доставка: {format_rub(cost.freight)}\n"
+        f"Пошлина: {format_rub(cost.duty)}\n"
+        f"Таможенный сбор: {format_rub(cost.clearance_fee)}\n"
+        f"Утильсбор: {format_rub(cost.util_fee)}\n"
+        f"Брокер и СВХ: {format_rub(cost.broker)}\n"
+        f"Комиссия компании: {format_rub(cost.commission)}\n\n"
+        f"<b>Итого: {format_rub(cost.total)}</b>\n\n"
+        "Расчет предварительный, по текущему курсу. Точную стоимость назовет менеджер."
+    )
+
+# Trigger via Inline button or Reply keyboard
+@router.callback_query(F.data == "calc_cost")
+async def start_calc_inline(callback: CallbackQuery, state: FSMContext):
+    await state.set_data({})
+    await callback.message.answer("Выберите страну покупки", reply_markup=get_estimate_country_keyboard())
+    await state.set_state(EstimateStates.waiting_for_country)
+    await callback.answer()
+
+@router.message(F.text == "Расчет стоимости авто")
+async def start_calc_reply(message: Message, state: FSMContext):
+    await state.set_data({})
+    await message.answer("Выберите страну покупки", reply_markup=get_estimate_country_keyboard())
+    await state.set_state(EstimateStates.waiting_for_country)
+
+@router.callback_query(F.data == "est_skip")
+async def skip_estimate(callback: CallbackQuery, state: FSMContext):
+    await state.set_data({})
+    await start_survey(callback.message, state)
+    await callback.answer()
+
+@router.callback_query(EstimateStates.waiting_for_country, F.data.startswith("est_country_"))
+async def process_country(callback: CallbackQuery, state: FSMContext):
+    country = callback.data.removeprefix("est_country_")
+    if country not in COUNTRY_CURRENCIES:
+        await callback.answer()
+        return
+    await state.update_data(country=country)
+    await callback.message.answer(
+        f"Введите цену авто в стране покупки, {COUNTRY_CURRENCIES[country]}",
+        reply_markup=get_cancel_keyboard()
+    )
+    await state.set_state(EstimateStates.waiting_for_price)
+    await callback.answer()
+
+@router.message(EstimateStates.waiting_for_price, F.text)
+async def process_price(message: Message, state: FSMContext):
+    if message.text == "Отменить":
+        return
+
+    price = parse_number(message.text)
+    if price is None or price > MAX_PRICE:
+        await message.answer("Введите цену числом, например 1 500 000")
+        return
+    await state.update_data(price=price)
+    await message.answer("Введите объем двигателя в см³ или литрах, например 1500 или 1.5")
+    await state.set_state(EstimateStates.waiting_for_engine)
+
+@router.message(EstimateStates.waiting_for_engine, F.text)
+async def process_engine(message: Message, state: FSMContext):
+    if message.text == "Отменить":
+        return
+
+    volume = parse_number(message.text)
+    if volume is not None and volume < 30:
+        volume *= 1000  # litres
+    if volume is None or not 500 <= volume <= 10000:
+        await message.answer("Введите объем двигателя от 500 до 10000 см³")
+        return
+    await state.update_data(engine_cc=round(volume))
+    await message.answer("Введите год выпуска или возраст авто в годах")
+    await state.set_state(EstimateStates.waiting_for_age)
+
+@router.message(EstimateStates.waiting_for_age, F.text)
+async def process_age(message: Message, state: FSMContext):
+    if message.text == "Отменить":
+        return
+
+    value = parse_number(message.text)
+    age = age_from_input(int(value)) if value is not None and value == int(value) and value < 10000 else None
+    if age is None or age > 50:
+        await message.answer("Введите год выпуска, например 2021, или возраст, например 3")
+        return
+    await state.update_data(age_years=age)
+    await message.answer("Введите мощность двигателя в л.с.")
+    await state.set_state(EstimateStates.waiting_for_power)
+
+@router.message(EstimateStates.waiting_for_power, F.text)
+async def process_power(message: Message, state: FSMContext, user: User):
+    if message.text == "Отменить":
+        return
+
+    power = parse_number(message.text)
+    if power is None or not 30 <= power <= 1500:
+        await message.answer("Введите мощность от 30 до 1500 л.с.")
+        return
+
+    data = await state.get_data()
+    item = EstimateInput(data["country"], data["price"], data["engine_cc"], data["age_years"], round(power))
+    cost = calculator.estimate(item)
+    await message.answer(format_estimate(item, cost), reply_markup=get_estimate_result_keyboard())
+    analytics.step(CALC_ESTIMATE, user)
+
+    # The estimate doubles as the car description if the user leaves a request
+    car_info = (
+        f"Расчет: {COUNTRY_NAMES[item.country]}, цена {item.price:.0f} {COUNTRY_CURRENCIES[item.country]}, "
+        f"{item.engine_cc} см³, {item.power_hp} л.с., возраст {item.age_years} г., итого ~{format_rub(cost.total)}"
+    )
+    await state.set_state(None)
+    await state.set_data({"car_info": car_info, "estimate": True})
+
+@router.callback_query(F.data == "est_lead")
+async def estimate_lead(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    if not data.get("estimate"):
+        # Stale button from an old estimate; start over
+        await state.set_data({})
+    await start_survey(callback.message, state)
+    await callback.answer()
@@ -1,48 +1,86 @@
 import asyncio
+import logging
 from aiogram import Router, F
 from aiogram.filters import Command
-from aiogram.types import Message, FSInputFile
+from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 
-from bot.database.crud import add_or_update_user, get_protected_message_ids
+from bot.database.crud import get_protected_message_ids
+from bot.database.buffer import user_upserts
+from bot.services.media import media_registry
+from bot.services.ledger import message_ledger
+from bot.database.models import User
 from bot.keyboards.reply import get_main_keyboard
 from bot.keyboards.inline import get_start_inline_keyboard
 
-router = Router()
+router = Router(name="commands")
 
 import contextlib
 from aiogram.exceptions import TelegramBadRequest
 
+DELETE_CHUNK = 100
+
+# chat_id -> running cleanup, and the newest trigger that arrived meanwhile
+_clear_tasks: dict[int, asyncio.Task] = {}
+_clear_pending: dict[int, Message] = {}
+
 async def delete_msg_safe(bot, chat_id, msg_id):
     with contextlib.suppress(Exception):
         await bot.delete_message(chat_id, msg_id)
 
 async def clear_chat(message: Message):
     bot = message.bot
-    # Gather message IDs from oldest (N-50) to newest (N) to delete top-down if fallback triggers
-    message_ids = list(range(max(0, message.message_id - 50), message.message_id + 1))
+    # Only ids the bot or the user really produced in the last 48h, up to the triggering message
+    message_ids = await message_ledger.take_deletable(message.chat.id, upto=message.message_id)
     protected_ids = await get_protected_message_ids(message.chat.id, message_ids)
     
     to_delete = [i for i in message_ids if i not in protected_ids]
     
-    if not to_delete:
-        return
-        
+    # deleteMessages accepts up to 100 ids per call
+    for start in range(0, len(to_delete), DELETE_CHUNK):
+        chunk = to_delete[start:start + DELETE_CHUNK]
+        try:
+            await bot.delete_messages(chat_id=message.chat.id, message_ids=chunk)
+        except TelegramBadRequest:
+            # Fallback gracefully if bulk deletion fails
+            tasks = [
+                delete_msg_safe(bot, message.chat.id, i)
+                for i in chunk
+            ]
+            await asyncio.gather(*tasks)
+
+async def _clear_loop(chat_id: int, message: Message):
     try:
-        # Fast bulk deletion
-        await bot.delete_messages(chat_id=message.chat.id, message_ids=to_delete)
-    except TelegramBadRequest:
-        # Fallback gracefully if bulk deletion fails (e.g., messages over 48h)
-        tasks = [
-            delete_msg_safe(bot, message.chat.id, i)
-            for i in to_delete
-        ]
-        await asyncio.gather(*tasks)
+        while message is not None:
+            try:
+                await clear_chat(message)
+            except Exception as e:
+                logging.error(f"Failed to clear chat {chat_id}: {e}")
+            message = _clear_pending.pop(chat_id, None)
+    finally:
+        _clear_tasks.pop(chat_id, None)
+
+def schedule_clear(message: Message):
+    """Clears the chat in the background, one cleanup per chat at a time."""
+    chat_id = message.chat.id
+    if chat_id in _clear_tasks:
+        # The running pass stops at its own trigger; one more pass covers the newer ones
+        _clear_pending[chat_id] = message
+        return
+    _clear_tasks[chat_id] = asyncio.create_task(_clear_loop(chat_id, message))
+
+async def cancel_clears():
+    """Stops background cleanups on shutdown, before the database closes."""
+    _clear_pending.clear()
+    tasks = list(_clear_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
 
-async def start_routine(message: Message, clear: bool = False):
+async def start_routine(message: Message, db_user: User, clear: bool = False):
     user = message.from_user
-    # Ensure they are in the DB
-    await add_or_update_user(user.id, user.full_name, user.username)
+    # Ensure they are in the DB (no-op when the profile has not changed)
+    await user_upserts.submit(user.id, user.full_name, user.username)
     
     greeting = (
         f"Привет, {user.full_name or user.username}! Добро пожаловать.\n\n"
@@ -63,26 +101,25 @@ async def start_routine(message: Message, clear: bool = False):
         "📞 Оставьте заявку и получите персональный подбор автомобиля вашей мечты! Нажимай кнопку ниже 👇🏼"
     )
     
-    keyboard = await get_main_keyboard(user.id)
+    keyboard = get_main_keyboard(db_user.is_staff)
     inline_kb = get_start_inline_keyboard()
     
-    photo = FSInputFile("data/hello2.jpeg")
-    await message.answer_photo(photo=photo, caption=greeting, reply_markup=inline_kb)
+    await media_registry.send_photo(message, "data/hello2.jpeg", caption=greeting, reply_markup=inline_kb)
     await message.answer("Выберите действие:", reply_markup=keyboard)
 
     if clear:
-        asyncio.create_task(clear_chat(message))
+        schedule_clear(message)
 
 @router.message(Command("start"))
-async def cmd_start(message: Message):
-    await start_routine(message, clear=True)
+async def cmd_start(message: Message, user: User):
+    await start_routine(message, user, clear=True)
 
 @router.message(Command("clear"))
-async def cmd_clear(message: Message):
-    await start_routine(message, clear=True)
+async def cmd_clear(message: Message, user: User):
+    await start_routine(message, user, clear=True)
     
 @router.message(F.text.in_({"Отменить", "Назад"}))
-async def process_cancel(message: Message, state: FSMContext = None):
+async def process_cancel(message: Message, user: User, state: FSMContext = None):
     if state:
         await state.clear()
-    await start_routine(message, clear=True)
+    await start_routine(message, user, clear=True)
@@ -1,13 +1,13 @@
-import os
-import json
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, FSInputFile, InputMediaDocument, InputMediaPhoto
+from aiogram.types import Message, CallbackQuery, InputMediaPhoto
 
-from bot.database.crud import get_cars_by_country, get_user_by_tg_id
-from bot.keyboards.inline import get_car_picks_keyboard, get_car_action_keyboard, get_not_found_car_keyboard
+from bot.database.models import User
+from bot.services.media import media_registry
+from bot.services.catalog import car_catalog, CarRecord
+from bot.keyboards.inline import get_car_picks_keyboard, get_car_carousel_keyboard
 from bot.keyboards.reply import get_faq_reply_keyboard
 
-router = Router()
+router = Router(name="menu")
 
 @router.message(F.text == "Процесс работы")
 async def how_we_work(message: Message):
@@ -145,42 +145,96 @@ async def faq_advantages(message: Message):
 async def car_picks(message: Message):
     await message.answer("Выберите страну:", reply_markup=get_car_picks_keyboard())
 
+COUNTRY_NAMES = {"japan": "Японии 🇯🇵", "korea": "Кореи 🇰🇷", "china": "Китая 🇨🇳"}
+
+# Telegram limits for media captions and text messages
+CAPTION_LIMIT = 1024
+MESSAGE_LIMIT = 4096
+
+def render_car(car: CarRecord, has_prev: bool, has_next: bool, is_admin: bool):
+    """Returns (first photo id or None, caption, keyboard) for one carousel page."""
+    photo_id = car.photo_ids[0] if car.photo_ids else None
+    limit = CAPTION_LIMIT if photo_id else MESSAGE_LIMIT
+    caption = car.description
+    # The full text stays one tap away under "Подробнее"
+    truncated = len(caption) > limit
+    if truncated:
+        caption = caption[:limit - 1] + "…"
+    keyboard = get_car_carousel_keyboard(car.country, car.id, has_prev, has_next, len(car.photo_ids), is_admin,
+                                         truncated)
+    return photo_id, caption, keyboard
+
 @router.callback_query(F.data.startswith("cars_"))
-async def show_cars(callback: CallbackQuery):
+async def show_cars(callback: CallbackQuery, user: User):
     country = callback.data.split("_")[1]
-    cars = await get_cars_by_country(country)
-    
-    country_names = {"japan": "Японии 🇯🇵", "korea": "Кореи 🇰🇷", "china": "Китая 🇨🇳"}
-    country_name = country_names.get(country, "")
+    cars, has_prev, has_next = await car_catalog.page(country)
+    country_name = COUNTRY_NAMES.get(country, "")
     
     if not cars:
         await callback.message.answer(f"Подборка авто из {country_name} пока пуста.")
         await callback.answer()
         return
         
-    user = await get_user_by_tg_id(callback.from_user.id)
-    is_admin = user and user['role'] in ('admin', 'manager')
+    is_admin = user is not None and user.is_staff
+    photo_id, caption, keyboard = render_car(cars[0], has_prev, has_next, is_admin)
     
     await callback.message.answer(f"Подборка авто из {country_name}:")
+    if photo_id:
+        await callback.message.answer_photo(photo_id, caption=caption, reply_markup=keyboard)
+    else:
+        await callback.message.answer(caption, reply_markup=keyboard)
     
-    for car in cars:
-        photo_ids = json.loads(car['photo_ids'])
-        
-        if photo_ids:
-            media = [InputMediaPhoto(media=pid) for pid in photo_ids]
-            # Telegram handles up to 10 items in media group
-            await callback.message.answer_media_group(media[:10])
-            
-        await callback.message.answer(
-            car['description'],
-            reply_markup=get_car_action_keyboard(car['id'], is_admin=is_admin)
-        )
-        
-    await callback.message.answer(
-        "Не нашли подходящий авто?",
-        reply_markup=get_not_found_car_keyboard()
-    )
-    
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("carpage_"))
+async def flip_cars(callback: CallbackQuery, user: User):
+    _, country, cursor_id, direction = callback.data.split("_")
+    cars, has_prev, has_next = await car_catalog.page(country, int(cursor_id), direction)
+    if not cars:
+        await callback.answer("Больше автомобилей нет.")
+        return
+
+    is_admin = user is not None and user.is_staff
+    photo_id, caption, keyboard = render_car(cars[0], has_prev, has_next, is_admin)
+
+    # Edit the carousel in place; swap the message only if photo/text kind differs
+    if photo_id and callback.message.photo:
+        await callback.message.edit_media(InputMediaPhoto(media=photo_id, caption=caption), reply_markup=keyboard)
+    elif not photo_id and callback.message.text:
+        await callback.message.edit_text(caption, reply_markup=keyboard)
+    else:
+        await callback.message.delete()
+        if photo_id:
+            await callback.message.answer_photo(photo_id, caption=caption, reply_markup=keyboard)
+        else:
+            await callback.message.answer(caption, reply_markup=keyboard)
+
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("cardesc_"))
+async def show_car_description(callback: CallbackQuery):
+    car = await car_catalog.get(int(callback.data.split("_")[1]))
+    if not car:
+        await callback.answer("Автомобиль не найден", show_alert=True)
+        return
+
+    for start in range(0, len(car.description), MESSAGE_LIMIT):
+        await callback.message.answer(car.description[start:start + MESSAGE_LIMIT])
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("carphotos_"))
+async def show_car_photos(callback: CallbackQuery):
+    car = await car_catalog.get(int(callback.data.split("_")[1]))
+    if not car:
+        await callback.answer("Автомобиль не найден", show_alert=True)
+        return
+
+    # Already split into groups of at most 10; a single photo cannot be a media group
+    for group in car.media_groups:
+        if len(group) == 1:
+            await callback.message.answer_photo(group[0].media)
+        else:
+            await callback.message.answer_media_group(list(group))
     await callback.answer()
 
 @router.message(F.text == "Пример договора")
@@ -191,22 +245,11 @@ async def contract_example(message: Message):
         "Япония": "data/ПРИМЕР ДОГОВОР ЯПОНИЯ.pdf"
     }
     
-    media = []
-    missing_countries = []
-
-    for country, path in paths.items():
-        if os.path.exists(path):
-            media.append(
-                InputMediaDocument(
-                    media=FSInputFile(path), 
-                    caption=f"Пример договора ({country})"
-                )
-            )
-        else:
-            missing_countries.append(country)
-
-    if media:
-        await message.answer_media_group(media)
+    missing_paths = await media_registry.send_documents(
+        message,
+        [(path, f"Пример договора ({country})") for country, path in paths.items()]
+    )
+    missing_countries = [country for country, path in paths.items() if path in missing_paths]
 
     for country in missing_countries:
         await message.answer(f"Файл договора для страны {country} не найден.")
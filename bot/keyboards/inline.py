@@ -14,15 +14,35 @@ def get_car_picks_keyboard() -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text="🇨🇳 Китай", callback_data="cars_china")]
     ])
 
+def get_estimate_country_keyboard() -> InlineKeyboardMarkup:
+    """Inline keyboard to pick the country for a cost estimate."""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🇯🇵 Япония", callback_data="est_country_japan")],
+        [InlineKeyboardButton(text="🇰🇷 Корея", callback_data="est_country_korea")],
+        [InlineKeyboardButton(text="🇨🇳 Китай", callback_data="est_country_china")],
+        [InlineKeyboardButton(text="Сразу оставить заявку", callback_data="est_skip")]
+    ])
+
+def get_estimate_result_keyboard() -> InlineKeyboardMarkup:
+    """Inline keyboard under a cost estimate."""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Оставить заявку", callback_data="est_lead")],
+        [InlineKeyboardButton(text="Новый расчет", callback_data="calc_cost")]
+    ])
+
 def get_admin_inline_keyboard(is_admin: bool = False) -> InlineKeyboardMarkup:
     """Inline keyboard for the admin panel."""
     buttons = [
         [InlineKeyboardButton(text="Список пользователей", callback_data="admin_users")],
+        [InlineKeyboardButton(text="Поиск заявок и авто", callback_data="admin_search")],
+        [InlineKeyboardButton(text="Экспорт в CSV", callback_data="admin_export")],
+        [InlineKeyboardButton(text="Статистика", callback_data="stats_7")],
         [InlineKeyboardButton(text="Добавить авто в подборку", callback_data="admin_add_car")],
         [InlineKeyboardButton(text="Назначить менеджера", callback_data="admin_assign_manager")]
     ]
     if is_admin:
         buttons.append([InlineKeyboardButton(text="Удалить менеджера", callback_data="admin_remove_manager")])
+        buttons.append([InlineKeyboardButton(text="Резервная копия БД", callback_data="admin_backup")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 def get_admin_add_car_country_keyboard() -> InlineKeyboardMarkup:
@@ -33,17 +53,65 @@ def get_admin_add_car_country_keyboard() -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text="🇨🇳 Китай", callback_data="add_car_china")]
     ])
 
-def get_car_action_keyboard(car_id: int, is_admin: bool = False) -> InlineKeyboardMarkup:
-    """Inline keyboard under a car description."""
-    buttons = [
-        [InlineKeyboardButton(text="Заказать подобный авто", callback_data=f"order_similar_{car_id}")]
-    ]
+def get_car_carousel_keyboard(country: str, car_id: int, has_prev: bool, has_next: bool,
+                              photo_count: int = 0, is_admin: bool = False,
+                              truncated: bool = False) -> InlineKeyboardMarkup:
+    """Inline keyboard under a car in the catalog carousel."""
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"carpage_{country}_{car_id}_prev"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="Далее ▶️", callback_data=f"carpage_{country}_{car_id}_next"))
+
+    buttons = [nav] if nav else []
+    if truncated:
+        buttons.append([InlineKeyboardButton(text="Подробнее", callback_data=f"cardesc_{car_id}")])
+    if photo_count > 1:
+        buttons.append([InlineKeyboardButton(text=f"Все фото ({photo_count})", callback_data=f"carphotos_{car_id}")])
+    buttons.append([InlineKeyboardButton(text="Заказать подобный авто", callback_data=f"order_similar_{car_id}")])
     if is_admin:
         buttons.append([InlineKeyboardButton(text="Удалить авто", callback_data=f"delete_car_{car_id}")])
+    buttons.append([InlineKeyboardButton(text="Не нашли подходящий? Расчитать другое авто", callback_data="calc_cost")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def get_not_found_car_keyboard() -> InlineKeyboardMarkup:
-    """Inline keyboard when no car matches."""
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Расчитать другое авто", callback_data="calc_cost")]
+USER_ROLE_FILTERS = ("all", "user", "manager", "admin")
+USER_PHONE_FILTERS = ("any", "yes", "no")
+
+def get_users_browser_keyboard(role: str, phone: str, first_id: int | None, last_id: int | None,
+                               has_prev: bool, has_next: bool) -> InlineKeyboardMarkup:
+    """Inline keyboard under a page of the admin user list."""
+    role_labels = {"all": "все", "user": "клиенты", "manager": "менеджеры", "admin": "админы"}
+    phone_labels = {"any": "любой", "yes": "есть", "no": "нет"}
+    next_role = USER_ROLE_FILTERS[(USER_ROLE_FILTERS.index(role) + 1) % len(USER_ROLE_FILTERS)]
+    next_phone = USER_PHONE_FILTERS[(USER_PHONE_FILTERS.index(phone) + 1) % len(USER_PHONE_FILTERS)]
+
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"usr_{role}_{phone}_prev_{first_id}"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="Далее ▶️", callback_data=f"usr_{role}_{phone}_next_{last_id}"))
+
+    buttons = [nav] if nav else []
+    buttons.append([
+        InlineKeyboardButton(text=f"Роль: {role_labels[role]}", callback_data=f"usr_{next_role}_{phone}_next_0"),
+        InlineKeyboardButton(text=f"Телефон: {phone_labels[phone]}", callback_data=f"usr_{role}_{next_phone}_next_0"),
     ])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+def get_search_results_keyboard(page: int, has_next: bool) -> InlineKeyboardMarkup:
+    """Inline keyboard under a page of search results."""
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"srch_{page - 1}"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="Далее ▶️", callback_data=f"srch_{page + 1}"))
+    return InlineKeyboardMarkup(inline_keyboard=[nav] if nav else [])
+
+STATS_PERIODS = (1, 7, 30)
+
+def get_stats_keyboard(days: int) -> InlineKeyboardMarkup:
+    """Inline keyboard under the statistics report to switch the period."""
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text=f"{'• ' if period == days else ''}{period} дн.", callback_data=f"stats_{period}")
+        for period in STATS_PERIODS
+    ]])
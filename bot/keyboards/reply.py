@@ -1,7 +1,6 @@
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
-from bot.database.crud import get_user_by_tg_id
 
-async def get_main_keyboard(telegram_id: int) -> ReplyKeyboardMarkup:
+def get_main_keyboard(is_staff: bool = False) -> ReplyKeyboardMarkup:
     """Returns the main reply keyboard. Adds Admin Panel if user is admin or manager."""
     keyboard = [
         [KeyboardButton(text="Расчет стоимости авто")],
@@ -11,9 +10,7 @@ async def get_main_keyboard(telegram_id: int) -> ReplyKeyboardMarkup:
     ]
 
     
-    # Check role
-    user = await get_user_by_tg_id(telegram_id)
-    if user and user['role'] in ('admin', 'manager'):
+    if is_staff:
         keyboard.append([KeyboardButton(text="Панель администратора")])
         
     return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
@@ -3,28 +3,99 @@ import logging
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 
-from bot.config import BOT_TOKEN
-from bot.database.db import init_db
-from bot.handlers import commands, survey, menu, admin
+from bot.config import BOT_TOKEN, BOT_MODE
+from bot.database.db import init_db, open_db, close_db
+from bot.database.buffer import user_upserts
+from bot.database.fsm import SQLiteStorage
+from bot.handlers import commands, calculator, survey, menu, admin
+from bot.middlewares.user import UserMiddleware
+from bot.middlewares.ledger import IncomingLedgerMiddleware, OutgoingLedgerMiddleware
+from bot.middlewares.outbound import OutboundScheduler
+from bot.middlewares.metrics import HandlerMetricsMiddleware, TelegramMetricsMiddleware
+from bot.middlewares.throttling import ThrottlingMiddleware
+from bot.middlewares.analytics import AnalyticsMiddleware
+from bot.metrics import register_gauges, start_metrics_server
+from bot.services.notifications import staff_notifier
+from bot.services.media import media_registry
+from bot.services.catalog import car_catalog
+from bot.services.ledger import message_ledger
+from bot.services.leads import lead_queue
+from bot.services.analytics import analytics
+from bot.services.maintenance import maintenance
+from bot.services.backup import backup_manager
+from bot.services.calculator import calculator as cost_calculator
+from bot.webhook import run_webhook
+
+def create_dispatcher(storage: SQLiteStorage | None = None) -> Dispatcher:
+    dp = Dispatcher(storage=storage)
+    dp.update.outer_middleware(UserMiddleware())
+    dp.message.outer_middleware(IncomingLedgerMiddleware())
+    # After the ledger, so dropped messages are still cleaned up later
+    throttling = ThrottlingMiddleware()
+    dp.message.outer_middleware(throttling)
+    dp.callback_query.outer_middleware(throttling)
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
+    dp.message.middleware(AnalyticsMiddleware())
+    dp.callback_query.middleware(AnalyticsMiddleware())
+
+    # Register Routers
+    dp.include_router(commands.router)
+    dp.include_router(calculator.router)
+    dp.include_router(survey.router)
+    dp.include_router(menu.router)
+    dp.include_router(admin.router)
+    return dp
 
 async def main():
     logging.basicConfig(level=logging.INFO)
     
     # Init DB
     await init_db()
+    await open_db()
+    user_upserts.start()
+    await media_registry.load()
+    await car_catalog.load()
+    message_ledger.start()
+    await lead_queue.start()
+    cost_calculator.load()
+    analytics.start()
+    maintenance.start()
+    backup_manager.start()
     
     # Initialize bot and dp
     bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode='HTML'))
-    dp = Dispatcher()
-
-    # Register Routers
-    dp.include_router(commands.router)
-    dp.include_router(survey.router)
-    dp.include_router(menu.router)
-    dp.include_router(admin.router)
+    scheduler = OutboundScheduler()
+    bot.session.middleware(scheduler)
+    bot.session.middleware(OutgoingLedgerMiddleware())
+    # Innermost, so it times the API call itself and not the scheduler queue
+    bot.session.middleware(TelegramMetricsMiddleware())
+    storage = SQLiteStorage()
+    storage.start()
+    dp = create_dispatcher(storage)
+    register_gauges(storage, scheduler)
+    metrics_runner = await start_metrics_server()
 
-    logging.info("Starting bot...")
-    await dp.start_polling(bot)
+    logging.info(f"Starting bot ({BOT_MODE})...")
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        await maintenance.stop()
+        await backup_manager.stop()
+        await staff_notifier.drain()
+        await commands.cancel_clears()
+        await storage.close()
+        await user_upserts.stop()
+        await lead_queue.stop()
+        await analytics.stop()
+        await message_ledger.stop()
+        await close_db()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -0,0 +1,82 @@
+import logging
+
+from aiohttp import web
+
+from bot.config import METRICS_HOST, METRICS_PORT
+from bot.database.buffer import user_upserts
+from bot.database.cache import user_cache
+from bot.database.fsm import SQLiteStorage
+from bot.middlewares.outbound import OutboundScheduler
+from bot.services.analytics import analytics
+from bot.services.backup import backup_manager
+from bot.services.leads import lead_queue
+from bot.services.ledger import message_ledger
+from bot.services.media import media_registry
+from bot.services.notifications import staff_notifier
+from bot.utils.metrics import registry
+
+def register_gauges(storage: SQLiteStorage, scheduler: OutboundScheduler):
+    """Exposes the counters the long-lived services already keep."""
+    registry.gauge("bot_fsm_records", "FSM records held in memory.", lambda: storage.size)
+    registry.gauge("bot_fsm_pending_writes", "FSM records waiting to be flushed.", lambda: storage.pending)
+
+    registry.gauge("bot_user_cache_entries", "Users in the row cache.", lambda: len(user_cache))
+    registry.gauge("bot_user_cache_hit_ratio", "Share of user lookups served from the cache.",
+                   lambda: user_cache.stats()["hit_rate"])
+    registry.gauge("bot_user_cache_lookups_total", "User cache lookups by result.",
+                   lambda: {("hit",): user_cache.hits, ("miss",): user_cache.misses}, ("result",), kind="counter")
+
+    registry.gauge("bot_media_sends_total", "Local media sends by whether the file had to be uploaded.",
+                   lambda: {("upload",): media_registry.uploads, ("reuse",): media_registry.reuses},
+                   ("source",), kind="counter")
+    registry.gauge("bot_user_upserts_total", "Profile updates by whether they reached the database.",
+                   lambda: {("written",): user_upserts.written, ("skipped",): user_upserts.skipped},
+                   ("result",), kind="counter")
+    registry.gauge("bot_user_upserts_pending", "Profile updates waiting to be written.", lambda: user_upserts.pending)
+
+    registry.gauge("bot_outbound_queue_depth", "Telegram calls waiting in the outbound scheduler.",
+                   lambda: scheduler.stats()["queue_depth"])
+    registry.gauge("bot_outbound_wait_max_seconds", "Longest time a call has waited in the scheduler.",
+                   lambda: scheduler.stats()["wait_max"])
+    registry.gauge("bot_outbound_retries_total", "Calls retried after flood control.",
+                   lambda: scheduler.retries, kind="counter")
+
+    registry.gauge("bot_ledger_chats", "Chats whose message ids are held in memory.", lambda: message_ledger.chats)
+    registry.gauge("bot_ledger_pending_writes", "Message ledger changes not yet persisted.",
+                   lambda: message_ledger.pending)
+
+    registry.gauge("bot_leads_pending", "Survey leads queued but not yet stored.", lambda: lead_queue.pending)
+    registry.gauge("bot_leads_written_total", "Survey leads stored by the lead queue.",
+                   lambda: lead_queue.written, kind="counter")
+    registry.gauge("bot_leads_rejected_total", "Survey leads the database rejected, kept in the rejected file.",
+                   lambda: lead_queue.rejected, kind="counter")
+
+    registry.gauge("bot_analytics_pending", "Analytics counters not yet added to the rollups.",
+                   lambda: analytics.pending)
+
+    registry.gauge("bot_backup_last_success_timestamp_seconds", "Unix time of the last database snapshot.",
+                   lambda: backup_manager.last_success)
+    registry.gauge("bot_backup_failures_total", "Database snapshots that failed.",
+                   lambda: backup_manager.failures, kind="counter")
+
+    registry.gauge("bot_notifications_pending", "Staff notifications still being delivered.",
+                   lambda: staff_notifier.pending)
+    registry.gauge("bot_notifications_total", "Staff notification messages by outcome.",
+                   lambda: {("sent",): staff_notifier.sent, ("failed",): staff_notifier.failed},
+                   ("result",), kind="counter")
+
+async def metrics(request: web.Request) -> web.Response:
+    return web.Response(text=registry.render(),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> web.AppRunner | None:
+    """Serves /metrics in the Prometheus text format. Disabled when port is 0."""
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Metrics available on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,48 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, TelegramObject
+
+from bot.services.analytics import FUNNEL_STATES, analytics
+
+# Callback data prefix -> event; the key is the first field after the prefix
+CLICK_EVENTS = (
+    ("cars_", "country"),
+    ("carpage_", "country_page"),
+    ("carphotos_", "car_photos"),
+    ("order_similar_", "car_order"),
+)
+
+class AnalyticsMiddleware(BaseMiddleware):
+    """
+    Inner message/callback middleware feeding the analytics counters: catalog
+    clicks by callback data, and funnel steps whenever the handler moves the
+    user into one of the funnel states. Handlers that finish a funnel count
+    that step themselves. Staff activity is not counted.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("user")
+        if user is not None and user.is_staff:
+            return await handler(event, data)
+
+        if isinstance(event, CallbackQuery) and event.data:
+            for prefix, name in CLICK_EVENTS:
+                if event.data.startswith(prefix):
+                    analytics.track(name, event.data[len(prefix):].split("_")[0])
+                    break
+
+        result = await handler(event, data)
+
+        state = data.get("state")
+        if state is not None:
+            # Served from the FSM storage cache, no query
+            new_state = await state.get_state()
+            if new_state != data.get("raw_state") and new_state in FUNNEL_STATES:
+                analytics.track("step", new_state)
+        return result
@@ -0,0 +1,38 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import Message
+
+from bot.services.ledger import message_ledger
+
+class IncomingLedgerMiddleware(BaseMiddleware):
+    """Outer message middleware: records every incoming message id in the ledger."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: dict[str, Any],
+    ) -> Any:
+        message_ledger.record(event.chat.id, event.message_id, event.date.timestamp())
+        return await handler(event, data)
+
+class OutgoingLedgerMiddleware(BaseRequestMiddleware):
+    """Bot session middleware: records the messages produced by send*/forward* calls."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> TelegramType:
+        # The session chain hands back the decoded result, not the raw Response
+        result = await make_request(bot, method)
+        if type(method).__name__.startswith(("Send", "Forward")):
+            for msg in result if isinstance(result, list) else [result]:
+                if isinstance(msg, Message):
+                    message_ledger.record(msg.chat.id, msg.message_id, msg.date.timestamp())
+        return result
@@ -0,0 +1,68 @@
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject
+
+from bot.utils.metrics import registry
+
+HANDLER_SECONDS = registry.histogram(
+    "bot_handler_seconds", "Duration of update handlers.", ("router", "handler"),
+)
+HANDLER_ERRORS = registry.counter(
+    "bot_handler_errors_total", "Update handlers that raised.", ("router", "handler", "error"),
+)
+TELEGRAM_SECONDS = registry.histogram(
+    "bot_telegram_request_seconds", "Duration of Telegram Bot API calls.", ("method",),
+)
+TELEGRAM_ERRORS = registry.counter(
+    "bot_telegram_request_errors_total", "Telegram Bot API calls that failed.", ("method", "error"),
+)
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Inner middleware: times the handler that matched the event. Registered on
+    the dispatcher's observers, so it covers every included router.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        router = data["event_router"].name
+        name = data["handler"].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            HANDLER_ERRORS.inc(router=router, handler=name, error=type(e).__name__)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, router=router, handler=name)
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Bot session middleware: times each Bot API call by method name. Register it
+    last so the time spent queued in the OutboundScheduler is not included.
+    """
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> TelegramType:
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            TELEGRAM_ERRORS.inc(method=name, error=type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - started, method=name)
@@ -0,0 +1,152 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from bot.utils.ratelimit import TokenBucket
+
+# Lower value = served first
+PRIORITY_REPLY = 0
+PRIORITY_NOTIFY = 1
+PRIORITY_CLEANUP = 2
+
+# Methods that never count against message limits (polling, callback answers, setup)
+UNTHROTTLED = ("Get", "AnswerCallbackQuery", "SetWebhook", "DeleteWebhook", "Close", "LogOut")
+
+_priority: ContextVar[int | None] = ContextVar("outbound_priority", default=None)
+
+@contextlib.contextmanager
+def outbound_priority(priority: int):
+    """Runs the enclosed Telegram calls with the given scheduler priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Bot session middleware that coordinates every outgoing request:
+    a per-chat token bucket, then a global token bucket served in priority
+    order (replies, staff notifications, deletions), and automatic waiting
+    on TelegramRetryAfter.
+    """
+
+    def __init__(self, global_rate: float = 30, private_rate: float = 1, private_burst: float = 3,
+                 group_rate: float = 20 / 60, group_burst: float = 5, max_retries: int = 3,
+                 max_chats: int = 10_000):
+        self._global = TokenBucket(global_rate)
+        self.private_rate, self.private_burst = private_rate, private_burst
+        self.group_rate, self.group_burst = group_rate, group_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._chats: OrderedDict[int | str, TokenBucket] = OrderedDict()
+        self._heap: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump_task: asyncio.Task | None = None
+        self._paused_until = 0.0
+
+        self.waiting = 0
+        self.requests = 0
+        self.retries = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.waiting,
+            "requests": self.requests,
+            "retries": self.retries,
+            "wait_avg": self.wait_total / self.requests if self.requests else 0.0,
+            "wait_max": self.wait_max,
+        }
+
+    @staticmethod
+    def _classify(method: TelegramMethod) -> int:
+        priority = _priority.get()
+        if priority is not None:
+            return priority
+        if type(method).__name__.startswith("Delete"):
+            return PRIORITY_CLEANUP
+        return PRIORITY_REPLY
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            is_group = isinstance(chat_id, int) and chat_id < 0
+            bucket = TokenBucket(self.group_rate, self.group_burst) if is_group \
+                else TokenBucket(self.private_rate, self.private_burst)
+            self._chats[chat_id] = bucket
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def _pump(self):
+        while self._heap:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            if not self._global.consume():
+                await asyncio.sleep(self._global.delay())
+                continue
+            _, _, future = heapq.heappop(self._heap)
+            if not future.done():
+                future.set_result(None)
+        self._pump_task = None
+
+    async def _acquire(self, priority: int, chat_id):
+        # Per-chat limits are about new messages; deletions only share the global budget
+        if chat_id is not None and priority != PRIORITY_CLEANUP:
+            await self._chat_bucket(chat_id).acquire()
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), future))
+        if self._pump_task is None:
+            self._pump_task = asyncio.create_task(self._pump())
+        await future
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> TelegramType:
+        if type(method).__name__.startswith(UNTHROTTLED):
+            return await make_request(bot, method)
+
+        priority = self._classify(method)
+        chat_id = getattr(method, "chat_id", None)
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            self.waiting += 1
+            try:
+                await self._acquire(priority, chat_id)
+            finally:
+                self.waiting -= 1
+            waited = time.monotonic() - started
+            self.requests += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                logging.warning(f"Flood control on {type(method).__name__}, retrying in {e.retry_after}s")
+                # Hold back everyone, not just this request
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                await asyncio.sleep(e.retry_after)
@@ -0,0 +1,108 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from bot.database.cache import TTLCache
+from bot.utils.ratelimit import SlidingWindowLimiter
+from bot.utils.metrics import registry
+
+# Texts that restart the bot: greeting photo, keyboard and a chat cleanup each time
+RESTART_TEXTS = {"/start", "/clear", "Отменить", "Назад"}
+
+# group -> (hits, window in seconds) per user
+DEFAULT_RULES = {
+    "restart": (3, 30),
+    "callback": (20, 10),
+    "message": (20, 10),
+}
+
+# Pagination and filter toggles: tapping back and forth repeats the same data on purpose
+PAGING_PREFIXES = ("carpage_", "srch_", "usr_", "stats_")
+
+THROTTLED = registry.counter("bot_throttled_total", "Updates dropped by the throttling middleware.", ("group", "reason"))
+
+def throttle_group(event: TelegramObject) -> str | None:
+    """Rule group for an event, or None if it is never throttled."""
+    if isinstance(event, CallbackQuery):
+        return "callback"
+    if isinstance(event, Message):
+        if event.media_group_id:
+            return None  # album parts arrive together by design
+        text = (event.text or "").strip()
+        if text.startswith("/"):
+            text = text.split(maxsplit=1)[0].split("@")[0]
+        return "restart" if text in RESTART_TEXTS else "message"
+    return None
+
+def collapse_key(group: str, event: TelegramObject) -> str | tuple | None:
+    """What makes two events "the same command"; None for free text, survey answers and paging."""
+    if group == "restart":
+        return group  # /start, /clear and Назад all run start_routine
+    if group == "callback" and not (event.data or "").startswith(PAGING_PREFIXES):
+        # The same button on the same message; other messages' buttons are other commands
+        return (event.message.message_id if event.message else None, event.data)
+    return None
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Outer message/callback middleware limiting each user per rule group with a
+    sliding window. Double taps are dropped: a restart command repeated within
+    `collapse_window` seconds, or a tap on a button whose previous tap is still
+    being handled. Staff are never throttled.
+    """
+
+    def __init__(self, rules: dict[str, tuple[int, float]] = DEFAULT_RULES, collapse_window: float = 2.0,
+                 maxsize: int = 100_000):
+        self._limiters = {
+            group: SlidingWindowLimiter(limit, window, maxsize)
+            for group, (limit, window) in rules.items()
+        }
+        self._recent = TTLCache(maxsize, collapse_window)
+        self._in_flight: set[tuple] = set()
+        # One "slow down" reply per user and window, not one per dropped update
+        self._warned = TTLCache(maxsize, max(window for _, window in rules.values()))
+
+    async def _reject(self, event: TelegramObject, user_id: int, group: str, reason: str):
+        THROTTLED.inc(group=group, reason=reason)
+        if isinstance(event, CallbackQuery):
+            # Always answer, otherwise the client keeps showing a spinner
+            text = "Слишком часто, подождите немного." if reason == "limit" else None
+            await event.answer(text)
+        elif reason == "limit" and self._warned.get(user_id) is None:
+            self._warned.set(user_id, True)
+            await event.answer("Слишком много запросов. Подождите немного и попробуйте снова.")
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("user")
+        from_user = data.get("event_from_user")
+        group = throttle_group(event)
+        if group is None or from_user is None or (user is not None and user.is_staff):
+            return await handler(event, data)
+
+        signature = collapse_key(group, event)
+        key = (from_user.id, signature)
+        if signature is not None and (self._recent.get(key) is not None or key in self._in_flight):
+            await self._reject(event, from_user.id, group, "repeat")
+            return None
+        if group == "restart":
+            self._recent.set(key, True)
+
+        limiter = self._limiters.get(group)
+        if limiter is not None and not limiter.hit(from_user.id):
+            await self._reject(event, from_user.id, group, "limit")
+            return None
+
+        if signature is None or group == "restart":
+            return await handler(event, data)
+        # Buttons collapse only while their handler runs, so a later tap always goes through
+        self._in_flight.add(key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(key)
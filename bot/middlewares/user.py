@@ -0,0 +1,34 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from bot.config import ADMIN_IDS
+from bot.database.crud import add_or_update_user, get_user_by_tg_id
+from bot.database.models import User
+
+class UserMiddleware(BaseMiddleware):
+    """
+    Outer update middleware: resolves the sender's users row once per update
+    and passes it to handlers and filters as `user` (None for updates without a sender).
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        user = None
+        if from_user and not from_user.is_bot:
+            row = await get_user_by_tg_id(from_user.id)
+            # Unknown users and admins from .env missing their role are upserted right away
+            if row is None or (from_user.id in ADMIN_IDS and row['role'] != 'admin'):
+                await add_or_update_user(from_user.id, from_user.full_name, from_user.username)
+                row = await get_user_by_tg_id(from_user.id)
+            if row is not None:
+                user = User.from_row(row)
+
+        data["user"] = user
+        return await handler(event, data)
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+
+from aiogram.types import Message
+
+CommitType = Callable[[list[Message]], Awaitable[None]]
+
+class _Batch:
+    __slots__ = ("messages", "commit", "touched", "flushing", "task")
+
+    def __init__(self, commit: CommitType):
+        self.messages: dict[int, Message] = {}
+        self.commit = commit
+        self.touched = 0.0
+        self.flushing = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+class MediaGroupCollector:
+    """
+    Buffers photo messages per chat until `debounce` seconds pass without a
+    new one, then hands the whole batch, ordered by message id, to a single
+    commit call. Album parts and photos sent one by one take the same path,
+    so concurrent updates never race on the FSM data.
+    """
+
+    def __init__(self, debounce: float = 0.8):
+        self.debounce = debounce
+        self._batches: dict[int, _Batch] = {}
+        # chat_id -> task whose batch is being committed
+        self._committing: dict[int, asyncio.Task] = {}
+
+    async def _run(self, chat_id: int, batch: _Batch):
+        loop = asyncio.get_running_loop()
+        while not batch.flushing.is_set():
+            remaining = batch.touched + self.debounce - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(batch.flushing.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+        # Later photos start a new batch from here on
+        del self._batches[chat_id]
+        messages = [batch.messages[i] for i in sorted(batch.messages)]
+
+        # Commits of one chat run in order, never concurrently
+        previous = self._committing.get(chat_id)
+        self._committing[chat_id] = batch.task
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            await batch.commit(messages)
+        except Exception as e:
+            logging.error(f"Failed to commit {len(messages)} photos for chat {chat_id}: {e}")
+        finally:
+            if self._committing.get(chat_id) is batch.task:
+                del self._committing[chat_id]
+
+    def collect(self, message: Message, commit: CommitType):
+        """Adds a message to its chat's batch; `commit` of the first message in a batch is used."""
+        chat_id = message.chat.id
+        batch = self._batches.get(chat_id)
+        if batch is None:
+            batch = self._batches[chat_id] = _Batch(commit)
+            batch.task = asyncio.create_task(self._run(chat_id, batch))
+        batch.messages[message.message_id] = message
+        batch.touched = asyncio.get_running_loop().time()
+
+    async def flush(self, chat_id: int):
+        """Commits the chat's pending batch right away and waits for every commit in progress."""
+        batch = self._batches.get(chat_id)
+        if batch is not None:
+            batch.flushing.set()
+            task = batch.task
+        else:
+            task = self._committing.get(chat_id)
+        if task is not None:
+            # The newest task waits for the older commits itself
+            await asyncio.shield(task)
+
+album_collector = MediaGroupCollector()
@@ -0,0 +1,111 @@
+import asyncio
+import contextlib
+import logging
+import time
+from collections import Counter
+
+from bot.database.crud import get_analytics_totals, save_analytics
+from bot.states.calc import CalcStates, EstimateStates, OrderSimilarStates
+
+HOUR = 3600
+
+# Funnel steps that are not a state: handlers track them with Analytics.step()
+CALC_ESTIMATE = "calc:estimate"
+CALC_LEAD = "calc:lead"
+SIMILAR_LEAD = "similar:lead"
+
+# Funnel name -> (title, steps). A step is an FSM state entered by the user,
+# counted by AnalyticsMiddleware, or one of the keys above; counts are shown in this order.
+FUNNELS = {
+    "calc": ("Расчет стоимости", (
+        (EstimateStates.waiting_for_country.state, "Выбор страны"),
+        (EstimateStates.waiting_for_price.state, "Цена"),
+        (EstimateStates.waiting_for_engine.state, "Объем двигателя"),
+        (EstimateStates.waiting_for_age.state, "Возраст"),
+        (EstimateStates.waiting_for_power.state, "Мощность"),
+        (CALC_ESTIMATE, "Расчет показан"),
+        (CalcStates.waiting_for_fio.state, "ФИО"),
+        (CalcStates.waiting_for_car_info.state, "Описание авто"),
+        (CalcStates.waiting_for_phone.state, "Телефон"),
+        (CALC_LEAD, "Заявка"),
+    )),
+    "similar": ("Заказ похожего авто", (
+        (OrderSimilarStates.waiting_for_fio.state, "ФИО"),
+        (OrderSimilarStates.waiting_for_phone.state, "Телефон"),
+        (SIMILAR_LEAD, "Заявка"),
+    )),
+}
+
+FUNNEL_STATES = {
+    state.state for group in (CalcStates, EstimateStates, OrderSimilarStates) for state in group.__states__
+}
+
+class Analytics:
+    """
+    In-memory counters per (hour, event, key), added to the analytics_hourly
+    rollups every `flush_interval` seconds. track() is a dict increment, so it
+    is cheap enough to call on every update; reports read only the rollups.
+    """
+
+    def __init__(self, flush_interval: float = 60.0):
+        self.flush_interval = flush_interval
+        self._counts: Counter[tuple[int, str, str]] = Counter()
+        self._task: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def pending(self) -> int:
+        """Number of counters not yet added to the rollups."""
+        return len(self._counts)
+
+    def track(self, event: str, key, n: int = 1):
+        hour = int(time.time()) // HOUR * HOUR
+        self._counts[(hour, event, str(key))] += n
+
+    def step(self, key: str, user=None):
+        """Counts a funnel step reached in a handler; staff activity is not counted."""
+        if user is None or not user.is_staff:
+            self.track("step", key)
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._counts:
+                return
+            counts, self._counts = self._counts, Counter()
+            try:
+                await save_analytics([(hour, event, key, n) for (hour, event, key), n in counts.items()])
+            except Exception:
+                # Counts are additive, so merging back is exact
+                self._counts.update(counts)
+                raise
+
+    async def totals(self, days: int) -> dict[str, Counter]:
+        """event -> Counter of keys over the last `days` days, including the current hour."""
+        await self.flush()
+        since = (int(time.time()) // HOUR - days * 24 + 1) * HOUR
+        totals: dict[str, Counter] = {}
+        for event, key, count in await get_analytics_totals(since):
+            totals.setdefault(event, Counter())[key] = count
+        return totals
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Failed to flush analytics: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush()
+
+analytics = Analytics()
@@ -0,0 +1,127 @@
+import asyncio
+import contextlib
+import glob
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from bot.config import BACKUP_DIR, BACKUP_INTERVAL_HOURS, BACKUP_KEEP
+from bot.database import db as database
+
+BACKUP_PREFIX = 'bot_database_'
+BACKUP_SUFFIX = '.sqlite.gz'
+
+class BackupManager:
+    """
+    Online snapshots of the bot database through SQLite's backup API. The copy
+    runs in a worker thread on its own read-only connection, `step_pages`
+    pages at a time; it holds one read transaction, so every step sees the
+    same snapshot and, in WAL mode, the writer is never blocked. The copy is
+    integrity-checked, gzipped and renamed into place, and only the newest
+    `keep` snapshots are kept.
+    """
+
+    def __init__(self, directory: str = BACKUP_DIR, keep: int = BACKUP_KEEP,
+                 interval: float = BACKUP_INTERVAL_HOURS * 3600, step_pages: int = 1024, step_sleep: float = 0.005):
+        self.directory = directory
+        self.keep = keep
+        self.interval = interval
+        self.step_pages = step_pages
+        self.step_sleep = step_sleep
+        self.failures = 0
+        self.last_success = 0.0
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def _copy(self, target: str):
+        source = sqlite3.connect(f"file:{database.DB_PATH}?mode=ro", uri=True, isolation_level=None)
+        dest = sqlite3.connect(target)
+        try:
+            # Pin one snapshot for all steps; otherwise each commit by the writer restarts the copy
+            source.execute("BEGIN")
+            source.execute("SELECT count(*) FROM sqlite_master").fetchone()
+            source.backup(dest, pages=self.step_pages, sleep=self.step_sleep)
+            source.execute("COMMIT")
+
+            # Checked on the copy, so the live database pays nothing for it
+            result = dest.execute("PRAGMA integrity_check").fetchall()
+            if result != [("ok",)]:
+                raise RuntimeError(f"integrity check failed: {result[:5]}")
+            # A self-contained file, without a -wal next to it
+            dest.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            dest.close()
+            source.close()
+
+    def _snapshot(self) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        # UTC with microseconds: names sort in time order across DST changes and never collide
+        stamp = datetime.now(timezone.utc).strftime('%Y-%m-%d_%H-%M-%S-%fZ')
+        path = os.path.join(self.directory, f"{BACKUP_PREFIX}{stamp}{BACKUP_SUFFIX}")
+        raw, partial = path + '.tmp', path + '.part'
+        try:
+            self._copy(raw)
+            with open(raw, 'rb') as src, gzip.open(partial, 'wb', compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            # Snapshots run one at a time, so nothing can take the name between the check and the rename
+            if os.path.exists(path):
+                raise RuntimeError(f"{path} already exists")
+            # Only complete snapshots ever carry the final name
+            os.replace(partial, path)
+        finally:
+            for leftover in (raw, partial):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(leftover)
+        self._rotate()
+        return path
+
+    def _rotate(self):
+        snapshots = self.snapshots()
+        for path in snapshots[self.keep:]:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+    def snapshots(self) -> list[str]:
+        """Complete snapshots, newest first."""
+        pattern = os.path.join(self.directory, f"{BACKUP_PREFIX}*{BACKUP_SUFFIX}")
+        return sorted(glob.glob(pattern), reverse=True)
+
+    async def snapshot(self) -> str:
+        """Takes a snapshot and returns its path; concurrent calls run one after another."""
+        async with self._lock:
+            started = time.perf_counter()
+            try:
+                path = await asyncio.to_thread(self._snapshot)
+            except Exception:
+                self.failures += 1
+                raise
+            self.last_success = time.time()
+            logging.info(f"Database snapshot {path} ({os.path.getsize(path)} bytes) "
+                         f"taken in {time.perf_counter() - started:.1f}s")
+            return path
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.snapshot()
+            except Exception as e:
+                logging.error(f"Database backup failed: {e}")
+
+    def start(self):
+        """Starts scheduled snapshots; BACKUP_INTERVAL_HOURS=0 leaves only manual ones."""
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+backup_manager = BackupManager()
@@ -0,0 +1,176 @@
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import date
+
+TARIFFS_PATH = 'data/tariffs.json'
+RATES_PATH = 'data/rates.json'
+
+COUNTRY_CURRENCIES = {"japan": "JPY", "korea": "KRW", "china": "CNY"}
+
+@dataclass(frozen=True, slots=True)
+class EstimateInput:
+    country: str
+    price: float        # in the country's currency
+    engine_cc: int
+    age_years: int
+    power_hp: int
+
+@dataclass(frozen=True, slots=True)
+class CostBreakdown:
+    """Every amount in RUB."""
+    price: float
+    local_fees: float
+    freight: float
+    duty: float
+    clearance_fee: float
+    util_fee: float
+    broker: float
+    commission: float
+
+    @property
+    def customs(self) -> float:
+        return self.duty + self.clearance_fee + self.util_fee
+
+    @property
+    def total(self) -> float:
+        return self.price + self.local_fees + self.freight + self.customs + self.broker + self.commission
+
+class _Brackets:
+    """Upper bounds in ascending order (the last one open) with a value each, looked up by bisect."""
+
+    def __init__(self, rows: list[dict], bound_key: str):
+        self.bounds = [row[bound_key] for row in rows if row[bound_key] is not None]
+        self.values = rows
+        if len(self.bounds) != len(rows) - 1 or self.bounds != sorted(self.bounds):
+            raise ValueError(f"Brackets by {bound_key} must be ascending and end with an open one")
+
+    def __getitem__(self, amount: float) -> dict:
+        return self.values[bisect_left(self.bounds, amount)]
+
+class TariffTables:
+    """The tariff file turned into bracket lookups once."""
+
+    def __init__(self, data: dict):
+        duty = data["duty"]
+        self.duty_new = _Brackets(duty["under_3"]["brackets"], "max_eur")
+        self.duty_mid = _Brackets(duty["3_to_5"]["brackets"], "max_cc")
+        self.duty_old = _Brackets(duty["over_5"]["brackets"], "max_cc")
+        self.clearance = _Brackets(data["clearance_fee"]["brackets"], "max_rub")
+        util = data["util_fee"]
+        self.util_base = util["base"]
+        self.util_personal = util["personal"]
+        self.util = _Brackets(util["brackets"], "max_cc")
+        self.countries = data["countries"]
+
+    @classmethod
+    def load(cls, path: str = TARIFFS_PATH) -> "TariffTables":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+class ExchangeRates:
+    """
+    RUB rates from a local JSON file that is updated out of band. The parsed
+    rates are cached; the file is re-read only when its mtime changes, and
+    checked at most every `check_interval` seconds.
+    """
+
+    def __init__(self, path: str = RATES_PATH, check_interval: float = 60):
+        self.path = path
+        self.check_interval = check_interval
+        self._rates: dict[str, float] = {}
+        self._mtime_ns: int | None = None
+        self._checked = 0.0
+
+    def _reload(self):
+        mtime_ns = os.stat(self.path).st_mtime_ns
+        if mtime_ns == self._mtime_ns:
+            return
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        self._rates = {code: float(rate) for code, rate in data["rates"].items()}
+        self._mtime_ns = mtime_ns
+        logging.info(f"Exchange rates loaded ({data.get('updated_at', 'no date')}): {self._rates}")
+
+    def get(self) -> dict[str, float]:
+        now = time.monotonic()
+        if not self._rates or now - self._checked >= self.check_interval:
+            self._checked = now
+            try:
+                self._reload()
+            except (OSError, ValueError, KeyError) as e:
+                if not self._rates:
+                    raise
+                # A half-written update should not break estimates; keep the last good rates
+                logging.error(f"Failed to reload exchange rates, keeping the previous ones: {e}")
+        return self._rates
+
+class CostCalculator:
+    """Customs and delivery estimate for a car bought in Japan, Korea or China."""
+
+    def __init__(self, tariffs_path: str = TARIFFS_PATH, rates_path: str = RATES_PATH):
+        self.tariffs_path = tariffs_path
+        self.rates = ExchangeRates(rates_path)
+        self._tables: TariffTables | None = None
+
+    def load(self):
+        """Reads the tariff tables and rates; call once at startup."""
+        self._tables = TariffTables.load(self.tariffs_path)
+        self.rates.get()
+
+    @property
+    def tables(self) -> TariffTables:
+        if self._tables is None:
+            self.load()
+        return self._tables
+
+    def _duty_eur(self, tables: TariffTables, value_eur: float, item: EstimateInput) -> float:
+        if item.age_years < 3:
+            bracket = tables.duty_new[value_eur]
+            return max(value_eur * bracket["rate"], item.engine_cc * bracket["min_eur_per_cc"])
+        brackets = tables.duty_mid if item.age_years <= 5 else tables.duty_old
+        return item.engine_cc * brackets[item.engine_cc]["eur_per_cc"]
+
+    def _util_fee(self, tables: TariffTables, item: EstimateInput) -> float:
+        age_key = "under_3" if item.age_years < 3 else "over_3"
+        personal = tables.util_personal
+        if item.engine_cc <= personal["max_cc"] and item.power_hp <= personal["max_hp"]:
+            return tables.util_base * personal[age_key]
+        return tables.util_base * tables.util[item.engine_cc][age_key]
+
+    def _estimate(self, tables: TariffTables, rates: dict[str, float], item: EstimateInput) -> CostBreakdown:
+        country = tables.countries.get(item.country)
+        if country is None:
+            raise ValueError(f"Unknown country: {item.country}")
+        rate = rates[country["currency"]]
+        price = item.price * rate
+        value_eur = price / rates["EUR"]
+        return CostBreakdown(
+            price=price,
+            local_fees=country["local_fees"] * rate,
+            freight=country["freight_rub"],
+            duty=self._duty_eur(tables, value_eur, item) * rates["EUR"],
+            clearance_fee=tables.clearance[price]["fee"],
+            util_fee=self._util_fee(tables, item),
+            broker=country["broker_rub"],
+            commission=country["commission_rub"],
+        )
+
+    def estimate(self, item: EstimateInput) -> CostBreakdown:
+        return self._estimate(self.tables, self.rates.get(), item)
+
+    def estimate_many(self, items: list[EstimateInput]) -> list[CostBreakdown]:
+        """Estimates a batch against one snapshot of tables and rates."""
+        tables, rates = self.tables, self.rates.get()
+        return [self._estimate(tables, rates, item) for item in items]
+
+def age_from_input(value: int, today: date | None = None) -> int:
+    """Accepts either an age in years or a model year."""
+    if value > 1900:
+        return max(0, (today or date.today()).year - value)
+    return value
+
+calculator = CostCalculator()
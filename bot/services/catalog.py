@@ -0,0 +1,131 @@
+import math
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+
+from aiogram.types import InputMediaPhoto
+
+from bot.database.crud import get_all_cars, get_car_photos, add_car, delete_car
+
+# Telegram accepts 2-10 items per media group
+MEDIA_GROUP_LIMIT = 10
+
+def chunk_media(items: list, size: int = MEDIA_GROUP_LIMIT) -> list[tuple]:
+    """
+    Splits items into as few groups of at most `size` as possible, with sizes
+    balanced so no group is a lone leftover (11 photos -> 6 + 5, not 10 + 1).
+    """
+    if not items:
+        return []
+    count = math.ceil(len(items) / size)
+    base, extra = divmod(len(items), count)
+    groups, start = [], 0
+    for i in range(count):
+        end = start + base + (1 if i < extra else 0)
+        groups.append(tuple(items[start:end]))
+        start = end
+    return groups
+
+@dataclass(frozen=True, slots=True)
+class CarRecord:
+    id: int
+    country: str
+    description: str
+    photo_ids: tuple[str, ...]
+    media_groups: tuple[tuple[InputMediaPhoto, ...], ...]
+
+    @classmethod
+    def build(cls, car_id: int, country: str, description: str, photo_ids) -> "CarRecord":
+        photo_ids = tuple(photo_ids)
+        return cls(
+            id=car_id,
+            country=country,
+            description=description,
+            photo_ids=photo_ids,
+            media_groups=tuple(chunk_media([InputMediaPhoto(media=pid) for pid in photo_ids])),
+        )
+
+    @classmethod
+    def from_row(cls, row, photo_ids) -> "CarRecord":
+        return cls.build(row['id'], row['country'], row['description'], photo_ids)
+
+class CarCatalog:
+    """
+    The whole car catalog kept in memory, per country and ordered by id.
+    Loaded once at startup and updated in place by add_car/delete_car,
+    so browsing never touches SQLite or JSON.
+    """
+
+    def __init__(self):
+        self._ids: dict[str, list[int]] = {}
+        self._cars: dict[str, list[CarRecord]] = {}
+        self._by_id: dict[int, CarRecord] = {}
+        self._loaded = False
+
+    async def load(self):
+        self._ids.clear()
+        self._cars.clear()
+        self._by_id.clear()
+        photos = await get_car_photos()
+        for row in await get_all_cars():
+            self._insert(CarRecord.from_row(row, photos.get(row['id'], [])))
+        self._loaded = True
+
+    async def _ensure_loaded(self):
+        if not self._loaded:
+            await self.load()
+
+    def _insert(self, car: CarRecord):
+        ids = self._ids.setdefault(car.country, [])
+        cars = self._cars.setdefault(car.country, [])
+        i = bisect_left(ids, car.id)
+        ids.insert(i, car.id)
+        cars.insert(i, car)
+        self._by_id[car.id] = car
+
+    def _remove(self, car_id: int):
+        car = self._by_id.pop(car_id, None)
+        if car is None:
+            return
+        ids, cars = self._ids[car.country], self._cars[car.country]
+        i = bisect_left(ids, car_id)
+        del ids[i]
+        del cars[i]
+
+    async def get(self, car_id: int) -> CarRecord | None:
+        await self._ensure_loaded()
+        return self._by_id.get(car_id)
+
+    async def page(self, country: str, cursor_id: int | None = None, direction: str = 'next', limit: int = 1):
+        """
+        Keyset page of a country's cars, newest first.
+        'next' returns cars older than cursor_id, 'prev' cars newer than it.
+        Returns (cars, has_prev, has_next).
+        """
+        await self._ensure_loaded()
+        ids = self._ids.get(country, [])
+        cars = self._cars.get(country, [])
+
+        if cursor_id is None:
+            start = max(0, len(cars) - limit)
+            return cars[start:][::-1], False, start > 0
+        if direction == 'prev':
+            j = bisect_right(ids, cursor_id)
+            return cars[j:j + limit][::-1], j + limit < len(cars), True
+        i = bisect_left(ids, cursor_id)
+        start = max(0, i - limit)
+        return cars[start:i][::-1], True, start > 0
+
+    async def add_car(self, country: str, description: str, photos: list[tuple[str, str | None]]) -> int:
+        """Adds a car with its (file_id, file_unique_id) photos; the first one is the cover."""
+        await self._ensure_loaded()
+        car_id = await add_car(country, description, photos)
+        self._insert(CarRecord.build(car_id, country, description, [file_id for file_id, _ in photos]))
+        return car_id
+
+    async def delete_car(self, car_id: int) -> bool:
+        await self._ensure_loaded()
+        success = await delete_car(car_id)
+        self._remove(car_id)
+        return success
+
+car_catalog = CarCatalog()
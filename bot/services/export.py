@@ -0,0 +1,33 @@
+import csv
+import os
+import tempfile
+from typing import AsyncIterator, Sequence
+
+from bot.database.crud import iter_users, iter_requests
+
+USER_COLUMNS = ('id', 'telegram_id', 'fullname', 'username', 'phone', 'role', 'join_date')
+REQUEST_COLUMNS = ('id', 'created_at', 'fio', 'car_info', 'phone', 'telegram_id', 'username')
+
+async def write_csv(rows: AsyncIterator, columns: Sequence[str], prefix: str) -> str:
+    """
+    Writes rows to a temporary CSV file one at a time and returns its path.
+    Memory use does not depend on the number of rows. The caller removes the file.
+    """
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix='.csv')
+    try:
+        # utf-8-sig so that Excel opens Cyrillic text correctly
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            async for row in rows:
+                writer.writerow([row[c] for c in columns])
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+async def export_users() -> str:
+    return await write_csv(iter_users(), USER_COLUMNS, 'users_')
+
+async def export_requests() -> str:
+    return await write_csv(iter_requests(), REQUEST_COLUMNS, 'requests_')
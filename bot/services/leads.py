@@ -0,0 +1,212 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+
+from bot.database.crud import add_leads
+
+JOURNAL_PATH = 'data/leads.journal'
+REJECTED_PATH = 'data/leads.rejected'
+
+# Errors caused by the lead itself; retrying it can never succeed
+LEAD_ERRORS = (sqlite3.IntegrityError, sqlite3.InterfaceError, sqlite3.DataError, ValueError, TypeError)
+
+def _utc_now() -> str:
+    # Same format as SQLite's CURRENT_TIMESTAMP
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+@dataclass(slots=True)
+class Lead:
+    telegram_id: int
+    fullname: str | None
+    username: str | None
+    fio: str
+    car_info: str
+    phone: str
+    created_at: str = field(default_factory=_utc_now)
+    key: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+    # Keep well-formed but absurd input from bloating the table
+    MAX_TEXT = 1000
+
+    def __post_init__(self):
+        self.fio = self.fio.strip()[:self.MAX_TEXT]
+        self.car_info = self.car_info.strip()[:self.MAX_TEXT]
+        self.phone = self.phone.strip()[:32]
+        if not (self.fio and self.car_info and self.phone):
+            raise ValueError("Lead needs fio, car_info and phone")
+
+class LeadQueue:
+    """
+    Survey leads are appended to a journal file and queued in memory; a
+    background writer stores them in batches of up to `max_batch`, one
+    transaction each, and empties the journal once nothing is pending.
+    submit() never waits on the database or on fsync. After a crash, start()
+    replays the journal; leads already stored are skipped by their key.
+    A batch failing `max_failures` times in a row is stored lead by lead,
+    and a lead the database rejects goes to the `rejected_path` file.
+    """
+
+    def __init__(self, path: str = JOURNAL_PATH, max_batch: int = 200,
+                 retry_interval: float = 5.0, sync_interval: float = 1.0,
+                 max_failures: int = 3, rejected_path: str = REJECTED_PATH):
+        self.path = path
+        self.max_batch = max_batch
+        self.retry_interval = retry_interval
+        self.sync_interval = sync_interval
+        self.max_failures = max_failures
+        self.rejected_path = rejected_path
+        self.written = 0
+        self.rejected = 0
+        self._failures = 0
+        self._pending: list[Lead] = []
+        self._journal = None
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def pending(self) -> int:
+        """Number of leads not yet stored in the database."""
+        return len(self._pending)
+
+    def _open(self):
+        if self._journal is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._journal = open(self.path, "a", encoding="utf-8")
+
+    def _load(self) -> list[Lead]:
+        if not os.path.exists(self.path):
+            return []
+        leads = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    leads.append(Lead(**json.loads(line)))
+                except (ValueError, TypeError):
+                    # A torn last line from a crash mid-write
+                    logging.warning(f"Skipping unreadable line in {self.path}")
+        return leads
+
+    def submit(self, lead: Lead):
+        """
+        Appends the lead to the journal and queues it. The append reaches the
+        OS right away, so it survives a crash of the process; it is fsynced in
+        the background. Until start() is called leads only go to the journal.
+        """
+        try:
+            self._open()
+            self._journal.write(json.dumps(asdict(lead), ensure_ascii=False) + "\n")
+            self._journal.flush()
+        except OSError as e:
+            # Still worth storing; it is just not crash-safe
+            logging.error(f"Failed to journal lead {lead.key}: {e}")
+        self._pending.append(lead)
+        self._wakeup.set()
+
+    def _reject(self, lead: Lead, error: Exception):
+        logging.error(f"Lead {lead.key} rejected by the database, moved to {self.rejected_path}: {error}")
+        self.rejected += 1
+        try:
+            with open(self.rejected_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({**asdict(lead), "error": str(error)}, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logging.error(f"Failed to save rejected lead {lead.key}: {e}; lead: {asdict(lead)}")
+
+    async def _store(self, batch: list[Lead]) -> int:
+        """Stores the batch; returns how many leads were stored rather than rejected."""
+        try:
+            await add_leads([asdict(lead) for lead in batch])
+            self._failures = 0
+            return len(batch)
+        except Exception:
+            self._failures += 1
+            if self._failures < self.max_failures:
+                raise
+
+        # The batch keeps failing: find the leads at fault instead of blocking everything behind them.
+        # Stored leads are skipped by their key if this stops half-way and runs again
+        logging.warning(f"Lead batch failed {self._failures} times, storing {len(batch)} leads one by one")
+        stored = 0
+        for lead in batch:
+            try:
+                await add_leads([asdict(lead)])
+                stored += 1
+            except LEAD_ERRORS as e:
+                self._reject(lead, e)
+        self._failures = 0
+        return stored
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.max_batch]
+                stored = await self._store(batch)
+                # New leads may have been appended meanwhile; only the batch is done (stored or rejected)
+                del self._pending[:len(batch)]
+                self.written += stored
+            # Everything journaled is stored now (no await since the last check)
+            if self._journal is not None:
+                self._journal.seek(0)
+                self._journal.truncate()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Failed to store {len(self._pending)} leads, retrying: {e}")
+                await asyncio.sleep(self.retry_interval)
+                self._wakeup.set()
+
+    async def _sync(self):
+        # Appends already survive a crash of the process; fsync covers the machine
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            if self._journal is None or not self._pending:
+                continue
+            # A duplicate descriptor stays valid even if the journal is truncated or closed meanwhile
+            fd = os.dup(self._journal.fileno())
+            try:
+                await asyncio.to_thread(os.fsync, fd)
+            except OSError as e:
+                logging.error(f"Failed to sync {self.path}: {e}")
+            finally:
+                os.close(fd)
+
+    async def start(self):
+        """Replays leads left in the journal by a previous run, then starts the writer."""
+        if self._tasks:
+            return
+        # Leads submitted before start() are in the journal too
+        known = {lead.key for lead in self._pending}
+        replayed = [lead for lead in self._load() if lead.key not in known]
+        if replayed:
+            logging.info(f"Replaying {len(replayed)} leads from {self.path}")
+            self._pending = replayed + self._pending
+        self._open()
+        self._tasks = [asyncio.create_task(self._run()), asyncio.create_task(self._sync())]
+        self._wakeup.set()
+
+    async def stop(self):
+        """Stops the writer and stores whatever is still pending."""
+        for task in self._tasks:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+        try:
+            await self.flush()
+        finally:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+lead_queue = LeadQueue()
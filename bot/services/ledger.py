@@ -0,0 +1,134 @@
+import asyncio
+import contextlib
+import logging
+import time
+from collections import OrderedDict, deque
+
+from bot.database.crud import get_chat_messages, save_chat_messages
+
+# Telegram refuses to delete messages older than 48 hours; keep a safety margin
+DELETE_HORIZON = 48 * 3600 - 300
+
+class MessageLedger:
+    """
+    Per-chat ring buffer of message ids the bot and the user actually produced.
+    Persisted lazily to chat_messages so clearing still works after a restart.
+    """
+
+    def __init__(self, per_chat: int = 100, max_chats: int = 10_000, flush_interval: float = 2.0):
+        self.per_chat = per_chat
+        self.max_chats = max_chats
+        self.flush_interval = flush_interval
+        self._chats: OrderedDict[int, deque] = OrderedDict()
+        self._added: dict[tuple[int, int], float] = {}
+        self._removed: set[tuple[int, int]] = set()
+        self._task: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def chats(self) -> int:
+        """Number of chats whose ids are held in memory."""
+        return len(self._chats)
+
+    @property
+    def pending(self) -> int:
+        """Number of additions and removals not yet persisted."""
+        return len(self._added) + len(self._removed)
+
+    def _remember(self, chat_id: int, entries):
+        self._chats[chat_id] = deque(entries, maxlen=self.per_chat)
+        self._chats.move_to_end(chat_id)
+        while len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+
+    def record(self, chat_id: int, message_id: int, sent_at: float | None = None):
+        key = (chat_id, message_id)
+        if key in self._added:
+            return
+        sent_at = sent_at or time.time()
+        self._added[key] = sent_at
+        self._removed.discard(key)
+
+        entries = self._chats.get(chat_id)
+        if entries is not None:
+            entries.append((message_id, sent_at))
+            self._chats.move_to_end(chat_id)
+
+    async def _entries(self, chat_id: int) -> deque:
+        entries = self._chats.get(chat_id)
+        if entries is not None:
+            self._chats.move_to_end(chat_id)
+            return entries
+
+        since = time.time() - DELETE_HORIZON
+        known = dict(await get_chat_messages(chat_id, since, self.per_chat))
+        known.update({mid: ts for (cid, mid), ts in self._added.items() if cid == chat_id})
+        for cid, mid in self._removed:
+            if cid == chat_id:
+                known.pop(mid, None)
+        self._remember(chat_id, sorted(known.items())[-self.per_chat:])
+        return self._chats[chat_id]
+
+    async def take_deletable(self, chat_id: int, upto: int) -> list[int]:
+        """
+        Removes and returns ids up to `upto` that are still young enough to delete.
+        Expired entries are dropped on the way.
+        """
+        entries = await self._entries(chat_id)
+        since = time.time() - DELETE_HORIZON
+
+        taken, kept = [], []
+        for message_id, sent_at in entries:
+            if sent_at < since:
+                self._forget(chat_id, message_id)
+            elif message_id <= upto:
+                taken.append(message_id)
+                self._forget(chat_id, message_id)
+            else:
+                kept.append((message_id, sent_at))
+        self._remember(chat_id, kept)
+        return sorted(set(taken))
+
+    def _forget(self, chat_id: int, message_id: int):
+        key = (chat_id, message_id)
+        if self._added.pop(key, None) is None:
+            self._removed.add(key)
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._added and not self._removed:
+                return
+            added, self._added = self._added, {}
+            removed, self._removed = self._removed, set()
+            try:
+                await save_chat_messages(
+                    [(cid, mid, ts) for (cid, mid), ts in added.items()],
+                    list(removed),
+                    time.time() - DELETE_HORIZON,
+                )
+            except Exception:
+                self._added = {**added, **self._added}
+                self._removed |= removed - set(self._added)
+                raise
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Failed to flush message ledger: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush()
+
+message_ledger = MessageLedger()
@@ -0,0 +1,125 @@
+import asyncio
+import contextlib
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timedelta, timezone
+
+from bot.config import REQUESTS_ARCHIVE_DAYS
+from bot.database.crud import archive_requests, incremental_vacuum, optimize_db, purge_protected_messages
+from bot.services.ledger import DELETE_HORIZON
+from bot.utils.metrics import registry
+
+MAINTENANCE_ROWS = registry.counter(
+    "bot_maintenance_rows_total", "Rows or pages handled by maintenance jobs.", ("job",),
+)
+MAINTENANCE_SECONDS = registry.histogram(
+    "bot_maintenance_step_seconds", "Duration of one maintenance step.", ("job",),
+)
+
+class Job:
+    """
+    A housekeeping task split into steps. `step` does one bounded unit of
+    work and returns how much it did; the job has more to do while a step
+    returns `batch`.
+    """
+
+    def __init__(self, name: str, interval: float, step: Callable[[int], Awaitable[int]], batch: int):
+        self.name = name
+        self.interval = interval
+        self.step = step
+        self.batch = batch
+        self.next_run = 0.0
+
+async def _purge_protected(limit: int) -> int:
+    # Telegram will not delete these messages anyway, so there is nothing left to protect
+    return await purge_protected_messages(time.time() - DELETE_HORIZON, limit)
+
+async def _archive_requests(limit: int) -> int:
+    if not REQUESTS_ARCHIVE_DAYS:
+        return 0
+    before = datetime.now(timezone.utc) - timedelta(days=REQUESTS_ARCHIVE_DAYS)
+    # Same format as SQLite's CURRENT_TIMESTAMP
+    return await archive_requests(before.strftime('%Y-%m-%d %H:%M:%S'), limit)
+
+async def _vacuum(pages: int) -> int:
+    # Report a full batch while free pages remain, so the job keeps stepping
+    left = await incremental_vacuum(pages)
+    return pages if left else 0
+
+async def _optimize(_: int) -> int:
+    await optimize_db()
+    return 0
+
+DEFAULT_JOBS = (
+    ("purge_protected_messages", 3600, _purge_protected, 1000),
+    ("archive_requests", 6 * 3600, _archive_requests, 500),
+    ("incremental_vacuum", 3600, _vacuum, 256),
+    ("optimize", 24 * 3600, _optimize, 1),
+)
+
+class MaintenanceScheduler:
+    """
+    Runs housekeeping jobs one at a time in small steps. Each step is its
+    own short transaction and steps are `pause` seconds apart, so handlers'
+    writes get the writer lock in between. A job that has not finished
+    within `budget` seconds continues on the next tick.
+    """
+
+    def __init__(self, jobs=DEFAULT_JOBS, tick: float = 60.0, budget: float = 2.0, pause: float = 0.2,
+                 start_delay: float = 60.0):
+        self.jobs = [Job(*job) for job in jobs]
+        self.tick = tick
+        self.budget = budget
+        self.pause = pause
+        self.start_delay = start_delay
+        self._task: asyncio.Task | None = None
+
+    async def run_job(self, job: Job) -> bool:
+        """Steps through the job until it is done or out of budget; returns True if it finished."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.budget
+        while True:
+            started = time.perf_counter()
+            done = await job.step(job.batch)
+            MAINTENANCE_SECONDS.observe(time.perf_counter() - started, job=job.name)
+            if done:
+                MAINTENANCE_ROWS.inc(done, job=job.name)
+            if done < job.batch:
+                return True
+            if loop.time() >= deadline:
+                return False
+            await asyncio.sleep(self.pause)
+
+    async def run_due(self):
+        now = time.monotonic()
+        for job in self.jobs:
+            if job.next_run > now:
+                continue
+            try:
+                finished = await self.run_job(job)
+            except Exception as e:
+                logging.error(f"Maintenance job {job.name} failed: {e}")
+                finished = True
+            # Unfinished work resumes on the next tick, finished jobs wait a full interval
+            job.next_run = time.monotonic() + (job.interval if finished else 0)
+
+    async def _run(self):
+        # Let startup traffic settle first
+        await asyncio.sleep(self.start_delay)
+        while True:
+            await self.run_due()
+            await asyncio.sleep(self.tick)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+maintenance = MaintenanceScheduler()
@@ -0,0 +1,145 @@
+import asyncio
+import contextlib
+import logging
+import os
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, FSInputFile, InputMediaDocument
+
+from bot.database.crud import get_media_files, save_media_file
+
+class MediaRegistry:
+    """
+    Uploads each local file once and reuses the Telegram file_id afterwards.
+    Entries are keyed by path and invalidated when the file's mtime or size changes.
+    Concurrent first sends of a file wait for one upload and reuse its file_id.
+    """
+
+    def __init__(self):
+        self._files: dict[str, tuple[int, int, str]] | None = None
+        # path -> lock held while the file is being uploaded
+        self._upload_locks: dict[str, asyncio.Lock] = {}
+        self.uploads = 0
+        self.reuses = 0
+
+    async def load(self):
+        self._files = await get_media_files()
+
+    async def _entries(self) -> dict[str, tuple[int, int, str]]:
+        if self._files is None:
+            await self.load()
+        return self._files
+
+    @staticmethod
+    def _stat(path: str) -> tuple[int, int] | None:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    async def _cached(self, path: str) -> bool:
+        """True if the file is on disk and its current version has a file_id."""
+        key = self._stat(path)
+        entry = (await self._entries()).get(path)
+        return key is not None and entry is not None and entry[:2] == key
+
+    @contextlib.asynccontextmanager
+    async def _uploading(self, paths: list[str]):
+        """Holds the upload locks of the paths that have no file_id yet, in a fixed order."""
+        async with contextlib.AsyncExitStack() as stack:
+            for path in sorted(set(paths)):
+                if not await self._cached(path):
+                    await stack.enter_async_context(self._upload_locks.setdefault(path, asyncio.Lock()))
+            yield
+
+    async def resolve(self, path: str) -> tuple[str | FSInputFile, tuple[int, int]] | None:
+        """Returns (file_id or FSInputFile, stat key), or None if the file is missing."""
+        key = self._stat(path)
+        if key is None:
+            return None
+
+        entry = (await self._entries()).get(path)
+        if entry and entry[:2] == key:
+            self.reuses += 1
+            return entry[2], key
+
+        self.uploads += 1
+        return FSInputFile(path), key
+
+    async def remember(self, path: str, key: tuple[int, int], file_id: str):
+        entries = await self._entries()
+        if entries.get(path) == (*key, file_id):
+            return
+        entries[path] = (*key, file_id)
+        await save_media_file(path, key[0], key[1], file_id)
+
+    async def forget(self, path: str):
+        (await self._entries()).pop(path, None)
+
+    async def send_photo(self, message: Message, path: str, **kwargs) -> Message | None:
+        # Resolved under the lock, so a sender that waited picks up the file_id just uploaded
+        async with self._uploading([path]):
+            return await self._send_photo(message, path, **kwargs)
+
+    async def _send_photo(self, message: Message, path: str, **kwargs) -> Message | None:
+        resolved = await self.resolve(path)
+        if resolved is None:
+            return None
+        media, key = resolved
+
+        try:
+            sent = await message.answer_photo(photo=media, **kwargs)
+        except TelegramBadRequest:
+            if isinstance(media, FSInputFile):
+                raise
+            # Cached file_id no longer valid (e.g. bot token changed): upload again
+            logging.warning(f"Cached file_id for {path} rejected, re-uploading")
+            await self.forget(path)
+            sent = await message.answer_photo(photo=FSInputFile(path), **kwargs)
+
+        await self.remember(path, key, sent.photo[-1].file_id)
+        return sent
+
+    async def send_documents(self, message: Message, documents: list[tuple[str, str]]) -> list[str]:
+        """
+        Sends (path, caption) pairs as one media group.
+        Returns the paths that were missing on disk.
+        """
+        async with self._uploading([path for path, _ in documents]):
+            return await self._send_documents(message, documents)
+
+    async def _send_documents(self, message: Message, documents: list[tuple[str, str]]) -> list[str]:
+        resolved, missing = [], []
+        for path, caption in documents:
+            item = await self.resolve(path)
+            if item is None:
+                missing.append(path)
+            else:
+                resolved.append((path, caption, *item))
+
+        if not resolved:
+            return missing
+
+        def build(force_upload: bool = False):
+            return [
+                InputMediaDocument(media=FSInputFile(path) if force_upload else media, caption=caption)
+                for path, caption, media, _ in resolved
+            ]
+
+        try:
+            sent = await message.answer_media_group(build())
+        except TelegramBadRequest:
+            if all(isinstance(media, FSInputFile) for _, _, media, _ in resolved):
+                raise
+            logging.warning("Cached document file_id rejected, re-uploading media group")
+            for path, *_ in resolved:
+                await self.forget(path)
+            sent = await message.answer_media_group(build(force_upload=True))
+
+        for (path, _, _, key), msg in zip(resolved, sent):
+            if msg.document:
+                await self.remember(path, key, msg.document.file_id)
+        return missing
+
+media_registry = MediaRegistry()
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+
+from aiogram import Bot
+
+from bot.config import NOTIFY_CONCURRENCY
+from bot.database.crud import get_all_admins_and_managers, add_protected_messages
+from bot.middlewares.outbound import outbound_priority, PRIORITY_NOTIFY
+
+class StaffNotifier:
+    """
+    Fans a text out to every admin and manager concurrently and records the
+    delivered messages as protected in one insert. Rate limits and flood
+    waits are left to the OutboundScheduler on the bot session.
+    """
+
+    def __init__(self, concurrency: int = NOTIFY_CONCURRENCY):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self.sent = 0
+        self.failed = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of notifications scheduled with notify_later and not finished yet."""
+        return len(self._tasks)
+
+    async def _send_one(self, bot: Bot, chat_id: int, text: str):
+        async with self._semaphore:
+            msg = await bot.send_message(chat_id, text)
+            return chat_id, msg.message_id
+
+    async def notify(self, bot: Bot, text: str) -> int:
+        """Sends `text` to all staff; returns the number of delivered messages."""
+        staff = await get_all_admins_and_managers()
+        # Staff messages queue behind direct replies in the outbound scheduler
+        with outbound_priority(PRIORITY_NOTIFY):
+            results = await asyncio.gather(
+                *(self._send_one(bot, u['telegram_id'], text) for u in staff),
+                return_exceptions=True
+            )
+
+        delivered = []
+        for user, result in zip(staff, results):
+            if isinstance(result, BaseException):
+                # Usually a staff member who blocked the bot
+                self.failed += 1
+                logging.warning(f"Failed to notify staff {user['telegram_id']}: {result}")
+            else:
+                delivered.append(result)
+
+        self.sent += len(delivered)
+        await add_protected_messages(delivered)
+        return len(delivered)
+
+    def notify_later(self, bot: Bot, text: str):
+        """Schedules notify() in the background so the calling handler can return."""
+        task = asyncio.create_task(self.notify(bot, text))
+        self._tasks.add(task)
+        task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logging.error(f"Staff notification failed: {task.exception()}")
+
+    async def drain(self):
+        """Waits for in-flight notifications (used on shutdown)."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+staff_notifier = StaffNotifier()
@@ -5,9 +5,17 @@ class CalcStates(StatesGroup):
     waiting_for_car_info = State()
     waiting_for_phone = State()
 
+class EstimateStates(StatesGroup):
+    waiting_for_country = State()
+    waiting_for_price = State()
+    waiting_for_engine = State()
+    waiting_for_age = State()
+    waiting_for_power = State()
+
 class AdminStates(StatesGroup):
     waiting_for_manager_id = State()
     waiting_for_remove_manager_id = State()
+    waiting_for_search_query = State()
 
 class AdminAddCarStates(StatesGroup):
     waiting_for_country = State()
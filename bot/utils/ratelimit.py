@@ -0,0 +1,85 @@
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float = 1) -> float:
+        """Seconds to wait until `amount` tokens are available (0 if available now)."""
+        self._refill()
+        if self._tokens >= amount:
+            return 0.0
+        return (amount - self._tokens) / self.rate
+
+    def consume(self, amount: float = 1) -> bool:
+        """Takes tokens without waiting; returns False if there are not enough."""
+        self._refill()
+        if self._tokens >= amount:
+            self._tokens -= amount
+            return True
+        return False
+
+    async def acquire(self, amount: float = 1):
+        async with self._lock:
+            while not self.consume(amount):
+                await asyncio.sleep(self.delay(amount))
+
+class SlidingWindowLimiter:
+    """
+    At most `limit` hits per key in any `window` seconds, using the sliding
+    window counter approximation: three numbers per key (window start, hits in
+    the current and the previous window). Keys idle for two windows are
+    dropped and at most `maxsize` keys are kept.
+    """
+
+    def __init__(self, limit: int, window: float, maxsize: int = 100_000):
+        self.limit = limit
+        self.window = window
+        self.maxsize = maxsize
+        self._keys: OrderedDict[Hashable, list] = OrderedDict()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _evict(self, now: float):
+        while self._keys:
+            key, entry = next(iter(self._keys.items()))
+            if len(self._keys) <= self.maxsize and now - entry[0] < 2 * self.window:
+                break
+            del self._keys[key]
+
+    def hit(self, key: Hashable) -> bool:
+        """Counts a hit for `key`; returns False (without counting) if over the limit."""
+        now = time.monotonic()
+        entry = self._keys.get(key)
+        if entry is None:
+            entry = self._keys[key] = [now, 0, 0]
+            self._evict(now)
+        else:
+            self._keys.move_to_end(key)
+            elapsed = now - entry[0]
+            if elapsed >= self.window:
+                windows = int(elapsed // self.window)
+                entry[2] = entry[1] if windows == 1 else 0
+                entry[1] = 0
+                entry[0] += windows * self.window
+
+        previous_weight = 1 - (now - entry[0]) / self.window
+        if entry[2] * previous_weight + entry[1] >= self.limit:
+            return False
+        entry[1] += 1
+        return True
@@ -0,0 +1,131 @@
+import asyncio
+import contextlib
+import logging
+import signal
+from typing import Any
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from bot.config import (
+    WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET,
+    WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_MAX_IN_FLIGHT,
+)
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Answers Telegram right away and processes the update in the background,
+    but never has more than `max_in_flight` updates being processed. When all
+    slots are taken the request waits, which pushes back on Telegram.
+
+    Only the public handler API is overridden; background tasks are tracked
+    here so drain() can wait for them before the database closes.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_in_flight: int, **kwargs: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self.max_in_flight = max_in_flight
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks: set[asyncio.Task] = set()
+        self.in_flight = 0
+
+    async def _feed_and_release(self, bot: Bot, update: dict[str, Any]):
+        try:
+            result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+            if isinstance(result, TelegramMethod):
+                await self.dispatcher.silent_call_request(bot=bot, result=result)
+        except Exception as e:
+            logging.exception(f"Failed to process webhook update: {e}")
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+
+        await self._slots.acquire()
+        try:
+            update = await request.json(loads=bot.session.json_loads)
+        except Exception:
+            self._slots.release()
+            return web.Response(status=400, text="Bad Request")
+
+        self.in_flight += 1
+        task = asyncio.create_task(self._feed_and_release(bot, update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def drain(self, timeout: float = 30):
+        """Waits for updates still being processed; stragglers are cancelled after `timeout` seconds."""
+        if not self._tasks:
+            return
+        logging.info(f"Waiting for {len(self._tasks)} webhook updates to finish...")
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logging.warning(f"Cancelled {len(pending)} webhook updates still running after {timeout}s")
+            await asyncio.wait(pending)
+
+WEBHOOK_HANDLER = web.AppKey("webhook_handler", BoundedRequestHandler)
+
+def create_app(dp: Dispatcher, bot: Bot, path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET,
+               max_in_flight: int = WEBHOOK_MAX_IN_FLIGHT) -> web.Application:
+    """aiohttp application serving the webhook on `path` and a health check on /health."""
+    app = web.Application()
+    handler = BoundedRequestHandler(dp, bot, max_in_flight, secret_token=secret or None)
+    handler.register(app, path=path)
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({
+            "status": "ok",
+            "in_flight": handler.in_flight,
+            "max_in_flight": handler.max_in_flight,
+        })
+
+    app.router.add_get("/health", health)
+    app[WEBHOOK_HANDLER] = handler
+    setup_application(app, dp, bot=bot)
+    return app
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Registers the webhook with Telegram and serves updates until SIGINT/SIGTERM or cancellation."""
+    app = create_app(dp, bot)
+    handler: BoundedRequestHandler = app[WEBHOOK_HANDLER]
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT)
+    await site.start()
+
+    await bot.set_webhook(
+        url=WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=min(WEBHOOK_MAX_IN_FLIGHT, 100),
+    )
+    logging.info(f"Webhook server listening on {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+
+    # Polling gets this from aiogram; without it SIGTERM would skip every flush below and in main()
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    signals = (signal.SIGTERM, signal.SIGINT)
+    for sig in signals:
+        with contextlib.suppress(NotImplementedError):  # not supported on Windows
+            loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+        logging.info("Stopping webhook server...")
+    finally:
+        for sig in signals:
+            with contextlib.suppress(NotImplementedError):
+                loop.remove_signal_handler(sig)
+        # Stop taking updates, let the accepted ones finish, then close the bot session;
+        # main() closes the database only after this returns
+        await site.stop()
+        await handler.drain()
+        await runner.cleanup()
@@ -0,0 +1,127 @@
+"""
+Webhook mode driven by a local HTTP client posting synthetic updates.
+
+    python -m unittest tests.test_webhook
+"""
+import asyncio
+import os
+import signal
+import unittest
+from unittest import mock
+
+os.environ.setdefault("BOT_TOKEN", "123456:webhook-test")
+
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot, Dispatcher
+from aiogram.types import Message
+
+import bot.webhook as webhook
+
+SECRET = "test-secret"
+PATH = "/webhook"
+
+def make_update(update_id: int, text: str = "hello") -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    }
+
+class WebhookAppTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.seen: list[str] = []
+        self.release = asyncio.Event()
+        self.release.set()
+
+        dp = Dispatcher()
+
+        @dp.message()
+        async def record(message: Message):
+            await self.release.wait()
+            self.seen.append(message.text)
+
+        self.bot = Bot(token=os.environ["BOT_TOKEN"])
+        app = webhook.create_app(dp, self.bot, path=PATH, secret=SECRET, max_in_flight=2)
+        self.handler: webhook.BoundedRequestHandler = app[webhook.WEBHOOK_HANDLER]
+        self.client = TestClient(TestServer(app))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        self.release.set()
+        await self.handler.drain(timeout=5)
+        await self.client.close()
+
+    async def post(self, body, secret: str | None = SECRET):
+        headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret is not None else {}
+        if isinstance(body, dict):
+            return await self.client.post(PATH, json=body, headers=headers)
+        return await self.client.post(PATH, data=body, headers=headers)
+
+    async def test_rejects_missing_or_wrong_secret(self):
+        response = await self.post(make_update(1), secret=None)
+        self.assertEqual(response.status, 401)
+        response = await self.post(make_update(2), secret="wrong")
+        self.assertEqual(response.status, 401)
+
+        await self.handler.drain(timeout=5)
+        self.assertEqual(self.seen, [])
+
+    async def test_accepts_valid_update(self):
+        response = await self.post(make_update(1, "привет"))
+        self.assertEqual(response.status, 200)
+
+        await self.handler.drain(timeout=5)
+        self.assertEqual(self.seen, ["привет"])
+
+    async def test_rejects_garbage_body(self):
+        response = await self.post(b"{not json")
+        self.assertEqual(response.status, 400)
+
+        # The slot taken for the bad request is given back
+        self.assertEqual(self.handler.in_flight, 0)
+        response = await self.post(make_update(1))
+        self.assertEqual(response.status, 200)
+
+    async def test_health_reports_in_flight(self):
+        self.release.clear()
+        await self.post(make_update(1))
+
+        response = await self.client.get("/health")
+        self.assertEqual(response.status, 200)
+        self.assertEqual(await response.json(), {"status": "ok", "in_flight": 1, "max_in_flight": 2})
+
+        self.release.set()
+        await self.handler.drain(timeout=5)
+        body = await (await self.client.get("/health")).json()
+        self.assertEqual(body["in_flight"], 0)
+
+    async def test_drain_waits_for_accepted_updates(self):
+        self.release.clear()
+        for update_id in range(2):
+            self.assertEqual((await self.post(make_update(update_id, str(update_id)))).status, 200)
+        self.assertEqual(self.seen, [])
+
+        asyncio.get_running_loop().call_later(0.05, self.release.set)
+        await self.handler.drain(timeout=5)
+        self.assertEqual(sorted(self.seen), ["0", "1"])
+
+class RunWebhookTest(unittest.IsolatedAsyncioTestCase):
+    async def test_sigterm_stops_server_and_drains(self):
+        bot = Bot(token=os.environ["BOT_TOKEN"])
+        dp = Dispatcher()
+        with mock.patch.object(webhook, "WEBAPP_PORT", 0), \
+                mock.patch.object(Bot, "set_webhook", new=mock.AsyncMock(return_value=True)), \
+                mock.patch.object(webhook.BoundedRequestHandler, "drain", autospec=True) as drain:
+            task = asyncio.create_task(webhook.run_webhook(dp, bot))
+            await asyncio.sleep(0.1)
+            os.kill(os.getpid(), signal.SIGTERM)
+            await asyncio.wait_for(task, timeout=5)
+        drain.assert_awaited_once()
+
+if __name__ == "__main__":
+    unittest.main()